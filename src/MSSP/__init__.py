@@ -4,8 +4,10 @@ from MSSP.utils import *
 
 from MSSP.importers.from_json import JsonImporter as MsspFromJson
 from MSSP.importers.from_spreadsheet import XlsImporter as MsspFromXls
+from MSSP.importers.from_sqlite import SqliteImporter as MsspFromSqlite
 
 from MSSP.json_exch import write_json as write_to_json
 from MSSP.json_exch import read_json
+from MSSP.sqlite_store import write_sqlite
 
 
@@ -0,0 +1,85 @@
+"""
+Bidirectional index over an attribute mapping table (_question_attributes or _target_attributes).
+
+The mapping tables link AttributeIDs to QuestionIDs or TargetIDs, one row per link.  An AttributeIndex answers
+"which records carry this attribute" and "which attributes does this record carry" from dicts, instead of
+scanning the table.  Attributes are listed per record in table order, duplicates included, so that lookups
+return exactly what a mask over the table would.
+"""
+
+from collections import defaultdict
+
+
+class AttributeIndex(object):
+    """
+    Internals:
+        obj._attrs[r] = list of AttributeIDs mapped to record r, in table order
+        obj._records[attr][r] = number of rows linking attr to record r
+    """
+    def __init__(self, mapping, key):
+        """
+
+        :param mapping: attribute mapping DataFrame with columns AttributeID and key
+        :param key: 'QuestionID' or 'TargetID'
+        :return:
+        """
+        self.key = key
+        self._attrs = defaultdict(list)
+        self._records = defaultdict(lambda: defaultdict(int))
+        self.rebuild(mapping)
+
+    def rebuild(self, mapping):
+        """
+        Re-index from scratch
+        :param mapping:
+        :return:
+        """
+        self._attrs.clear()
+        self._records.clear()
+        for r, attr in zip(mapping[self.key].tolist(), mapping['AttributeID'].tolist()):
+            self._attrs[r].append(attr)
+            self._records[attr][r] += 1
+
+    def records(self, attr):
+        """
+        Sorted list of record IDs carrying the attribute
+        """
+        if attr not in self._records:
+            return []
+        return sorted(self._records[attr].keys())
+
+    def attributes(self, r_index):
+        """
+        List of AttributeIDs mapped to the record, in table order
+        """
+        if r_index not in self._attrs:
+            return []
+        return list(self._attrs[r_index])
+
+    def count(self, r_index, attr):
+        """
+        Number of rows linking attr to the record
+        """
+        if attr not in self._records:
+            return 0
+        return self._records[attr].get(r_index, 0)
+
+    def add(self, r_index, attr):
+        """
+        Record a row appended to the table
+        """
+        self._attrs[r_index].append(attr)
+        self._records[attr][r_index] += 1
+
+    def remove(self, r_index, attr):
+        """
+        Record the removal of every row linking attr to the record
+        """
+        if self.count(r_index, attr) == 0:
+            return
+        self._attrs[r_index] = [a for a in self._attrs[r_index] if a != attr]
+        if len(self._attrs[r_index]) == 0:
+            del self._attrs[r_index]
+        del self._records[attr][r_index]
+        if len(self._records[attr]) == 0:
+            del self._records[attr]
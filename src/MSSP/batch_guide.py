@@ -0,0 +1,199 @@
+"""
+Non-interactive guide runner.
+
+Re-scores a collection of stored fishery answer files against an engine snapshot and writes the
+*.monitoring.json / *.assessment.json / *.controlrules.json reports next to each answers file (or into an output
+directory).  The work is spread over a process pool; each worker loads the engine snapshot once and reuses it
+for every answers file it is handed; a snapshot database written by sqlite_store.write_sqlite (*.db) loads
+faster than JSON.  With --lines, reports are streamed as compact JSON Lines
+(*.monitoring.jsonl etc., gzipped with --gzip) instead.
+
+From a shell:
+
+    python -m MSSP.batch_guide json/current 'json/current/*answers.json' --processes 4
+
+Questions that the answers file does not cover are not prompted for; they are left unanswered (unanswered
+criteria fail) and listed in the run summary.
+"""
+
+from __future__ import print_function
+
+import os
+import glob
+import multiprocessing
+
+from MSSP.utils import defaultdir, selectors, check_sel
+from MSSP.exceptions import BadSelectorError
+from MSSP.json_exch import json_parts
+from MSSP.importers.from_json import JsonImporter
+from MSSP.importers.from_sqlite import SqliteImporter
+from MSSP.fishery_guide import FisheryGuide
+
+
+default_pattern = '*answers.json'
+
+_worker_engine = None  # one engine per worker process
+
+
+def _abs_path(path):
+    if not os.path.isabs(path):
+        path = os.path.join(defaultdir, path)
+    return os.path.normpath(path)
+
+
+def _is_report(filename):
+    """
+    True for files written by FisheryGuide.save_guide or belonging to an engine snapshot
+    """
+    base = os.path.basename(filename)
+    if base in [k + '.json' for k in json_parts]:
+        return True
+    return any(base.endswith('.%s.%s' % (sel.lower(), ext)) for sel in selectors
+               for ext in ('json', 'jsonl', 'jsonl.gz'))
+
+
+def answer_files(answers):
+    """
+    Expand a directory, glob pattern, filename, or list of any of those into a sorted list of answers files.
+    Engine snapshot parts and previously written guide reports are skipped.
+    :param answers: directory (searched for *answers.json), glob pattern, or filename; absolute or relative to
+     defaultdir
+    :return: list of absolute filenames
+    """
+    if isinstance(answers, (list, tuple)):
+        files = []
+        for a in answers:
+            files.extend(answer_files(a))
+        return sorted(set(files))
+
+    path = _abs_path(answers)
+    if os.path.isdir(path):
+        path = os.path.join(path, default_pattern)
+    return sorted(f for f in glob.glob(path) if os.path.isfile(f) and not _is_report(f))
+
+
+def load_snapshot(snapshot):
+    """
+    Engine for a snapshot: a snapshot database (*.db, *.sqlite), or JSON
+    """
+    if snapshot.endswith(('.db', '.sqlite')):
+        return SqliteImporter(snapshot)
+    return JsonImporter(snapshot)
+
+
+def _init_worker(snapshot):
+    global _worker_engine
+    _worker_engine = load_snapshot(snapshot)
+
+
+def run_guide(engine, filename, sels=selectors, outdir=None, lines=False, compress=False):
+    """
+    Load one answers file and write a guide report for each selector, without prompting.
+    :param engine: an MsspDataStore
+    :param filename: answers file
+    :param sels: selectors to report on
+    :param outdir: directory for the reports (default: alongside the answers file)
+    :param lines: (default False) stream compact JSON Lines reports instead of indented JSON
+    :param compress: (default False) gzip JSON Lines reports
+    :return: dict with keys 'Answers', 'Reports' (list of files written), 'Unanswered' (sorted QuestionIDs)
+    """
+    guide = FisheryGuide(engine, filename, interactive=False)
+    guide.load_answers()
+    if outdir is None:
+        out_file = None
+    else:
+        out_file = os.path.join(_abs_path(outdir), os.path.basename(filename))
+
+    reports = []
+    for sel in sels:
+        if lines:
+            reports.append(guide.stream_guide(sel, filename=out_file, compress=compress, compact=True))
+        else:
+            reports.append(guide.save_guide(guide.guide(sel), filename=out_file))
+    return {
+        'Answers': filename,
+        'Reports': reports,
+        'Unanswered': sorted(guide.unanswered)
+    }
+
+
+def _run_one(args):
+    filename, sels, outdir, lines, compress = args
+    try:
+        return run_guide(_worker_engine, filename, sels=sels, outdir=outdir, lines=lines, compress=compress)
+    except Exception as e:
+        # one bad answers file should not sink the whole batch
+        return {
+            'Answers': filename,
+            'Reports': [],
+            'Error': '%s: %s' % (type(e).__name__, e)
+        }
+
+
+def run_batch(snapshot, answers, sels=selectors, processes=None, outdir=None, lines=False, compress=False):
+    """
+    Re-run every answers file against an engine snapshot.
+    :param snapshot: JSON engine snapshot (directory or file, as accepted by MsspFromJson)
+    :param answers: directory, glob pattern, filename, or list of these (see answer_files)
+    :param sels: selectors to report on (default: all)
+    :param processes: number of worker processes (default: cpu count). 1 runs in the current process.
+    :param outdir: directory for the reports (default: alongside each answers file)
+    :param lines: (default False) stream compact JSON Lines reports instead of indented JSON
+    :param compress: (default False) gzip JSON Lines reports
+    :return: list of result dicts, one per answers file, in filename order
+    """
+    if isinstance(sels, basestring):
+        sels = [sels]
+    for sel in sels:
+        if not check_sel(sel):
+            raise BadSelectorError('Selector must be one of %s' % list(selectors))
+
+    files = answer_files(answers)
+    if len(files) == 0:
+        print('No answers files found for %s' % answers)
+        return []
+    if outdir is not None and not os.path.exists(_abs_path(outdir)):
+        os.makedirs(_abs_path(outdir))
+
+    jobs = [(f, sels, outdir, lines, compress) for f in files]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+
+    if processes <= 1:
+        _init_worker(snapshot)
+        results = [_run_one(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(snapshot,))
+        try:
+            results = pool.map(_run_one, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for r in results:
+        if 'Error' in r:
+            print('%s: FAILED (%s)' % (r['Answers'], r['Error']))
+        elif len(r['Unanswered']) > 0:
+            print('%s: %d questions unanswered: %s' % (r['Answers'], len(r['Unanswered']), r['Unanswered']))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write guide reports for stored fishery answers files.')
+    parser.add_argument('snapshot', help='engine snapshot (JSON directory or file, or snapshot database)')
+    parser.add_argument('answers', nargs='+', help='answers files, directories, or glob patterns')
+    parser.add_argument('--selector', '-s', action='append', choices=selectors,
+                        help='selector to report on (repeatable; default all)')
+    parser.add_argument('--processes', '-p', type=int, default=None)
+    parser.add_argument('--outdir', '-o', default=None)
+    parser.add_argument('--lines', action='store_true', help='write compact JSON Lines reports')
+    parser.add_argument('--gzip', action='store_true', help='gzip JSON Lines reports (implies --lines)')
+    args = parser.parse_args()
+
+    run_batch(os.path.abspath(args.snapshot), [os.path.abspath(a) for a in args.answers],
+              sels=args.selector or selectors, processes=args.processes,
+              outdir=None if args.outdir is None else os.path.abspath(args.outdir),
+              lines=args.lines or args.gzip, compress=args.gzip)
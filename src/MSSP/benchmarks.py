@@ -0,0 +1,335 @@
+"""
+Timing checks for the engine's bulk operations.
+
+serialize() builds its criteria and caveats in single vectorized passes over the mapping tables, and
+SemanticElementSet.from_json() loads elements in bulk.  This module keeps the element-by-element implementations
+they replaced as references, checks that both produce the same results, and times them against an engine
+snapshot.  The serializer reference runs on a copy of the engine's tables decoded back to the importers' form, so
+it shares no code with the interned tables or the attribute index.  From a shell:
+
+    python -m MSSP.benchmarks json/current
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import uuid
+
+import numpy as np
+
+from MSSP.utils import convert_reference_to_subject
+from MSSP.exceptions import MsspError
+from MSSP.interning import UNPARSED
+from MSSP.json_exch import read_json
+from MSSP.colormap import Colormap
+from MSSP.semantic_elements import SemanticElement, SemanticElementSet
+from MSSP.importers.from_json import JsonImporter
+
+
+def _decode_table(table, interners=None, ids=('QuestionID', 'TargetID'), answers=('Threshold', 'Answer')):
+    """
+    Undo interning.intern_table: UUID objects for codes, int64 IDs, None for UNPARSED answers
+    """
+    decoded = table.copy()
+    for column, interner in (interners or dict()).items():
+        if column in decoded:
+            decoded[column] = interner.decode(decoded[column].tolist())
+    for column in ids:
+        if column in decoded:
+            decoded[column] = decoded[column].values.astype(np.int64)
+    for column in answers:
+        if column in decoded:
+            decoded[column] = [None if a == UNPARSED else a for a in decoded[column].tolist()]
+    return decoded
+
+
+class RowwiseStore(object):
+    """
+    An engine's content in the form MsspDataStore held it before its tables were interned: the importers' mapping
+    tables (UUIDs in AttributeID and NoteID, None for unparsed answers) and the colormap as a DataFrame.  serialize()
+    and the helpers it calls are the original iterrows / groupby-iterrows implementation, kept verbatim as the
+    reference for MsspDataStore.serialize().
+    """
+    def __init__(self, E):
+        """
+
+        :param E: an MsspDataStore
+        :return:
+        """
+        self._attributes = E._attributes
+        self._notes = E._notes
+        self._questions = E._questions
+        self._targets = E._targets
+        E._flush_attr_edits()
+        self._question_attributes = _decode_table(E._question_attributes, {'AttributeID': E._attr_codes})
+        self._target_attributes = _decode_table(E._target_attributes, {'AttributeID': E._attr_codes})
+        self._criteria = _decode_table(E._criteria)
+        self._caveats = _decode_table(E._caveats, {'NoteID': E._note_codes})
+        self.colormap = E.colormap.to_frame()
+
+    def _color_of_cell(self, element):
+        """
+        Return the color encoded by the element's fill_color
+        :param element:
+        :return:
+        """
+        return self.colormap[self.colormap['RGB'] == element.fill_color]['ColorName'].iloc[0]
+
+    def _make_attr_list(self, index, record='question'):
+        """
+        List of attributes associated with a given record
+        :param record: 'question' or 'target'
+        :param index:
+        :return:
+        """
+        if record == 'question':
+            mapping = self._question_attributes
+            key = 'QuestionID'
+        elif record == 'target':
+            mapping = self._target_attributes
+            key = 'TargetID'
+        else:
+            raise MsspError('Invalid record specifier %s' % record)
+        return mapping.loc[mapping[key] == index, 'AttributeID'].tolist()
+
+    def serialize(self):
+        """
+        The row-wise serializer
+        :return: the same dict as MsspDataStore.serialize()
+        """
+
+        questions = []
+        targets = []
+        criteria = []
+        caveats = []
+        colormap = []
+        attributes = []
+        notes = []
+
+        attr_set = set()
+        note_set = set()
+
+        print("Creating {0} questions...".format(len(self._questions)))
+        for k in range(len(self._questions)):
+            v = self._questions[k]
+            attr_list = self._make_attr_list(k, record='question')
+            if len(attr_list) == 0:
+                continue
+            add = {
+                "QuestionID": k,
+                "References": [convert_reference_to_subject(i) for i in v.references],
+                "ValidAnswers": v.valid_answers,
+                "Attributes": [str(i) for i in attr_list]
+            }
+            if v.title is not None:
+                add["Title"] = str(v.title)
+            if v.category is not None:
+                add["Category"] = str(v.category)
+            for i in attr_list:
+                attr_set.add(i)
+            if len(v.satisfied_by) > 0:
+                add["SatisfiedBy"] = list(v.satisfied_by)
+            questions.append(add)
+
+        print("Creating {0} targets...".format(len(self._targets)))
+        for k in range(len(self._targets)):
+            v = self._targets[k]
+            attr_list = self._make_attr_list(k, record='target')
+            if len(attr_list) == 0:
+                continue
+            add = {
+                "TargetID": k,
+                "Reference": convert_reference_to_subject(v.reference()),
+                "Attributes": [str(i) for i in attr_list]
+            }
+            if v.title is not None:
+                add["Title"] = str(v.title)
+            if v.category is not None:
+                add["Category"] = str(v.category)
+            for i in attr_list:
+                attr_set.add(i)
+            targets.append(add)
+
+        print("Creating {0} criteria...".format(len(self._criteria)))
+        for i, k in self._criteria.iterrows():
+            threshold = self._questions[k['QuestionID']].valid_answers[k['Threshold']]
+            add = {
+                "QuestionID": long(k['QuestionID']),
+                "Threshold": threshold,
+                "TargetID": long(k['TargetID'])
+            }
+            criteria.append(add)
+
+        cav_groups = self._caveats.groupby(['QuestionID', 'TargetID'])
+
+        print("Creating {0} caveats...".format(len(cav_groups)))
+        for (qid, tid), group in cav_groups:
+            answers = [{"Answer": a} for i, a in enumerate(self._questions[qid].valid_answers)]
+            for i, r in group.iterrows():
+                answers[r['Answer']]['NoteID'] = str(r['NoteID'])
+                note_set.add(r['NoteID'])
+            add = {
+                "QuestionID": qid,
+                "TargetID": tid,
+                "Answers": answers
+            }
+            caveats.append(add)
+
+        print("Creating {0} attributes...".format(len(attr_set)))
+        for attr in attr_set:
+            attributes.append({
+                "AttributeID": str(attr),
+                "AttributeText": self._attributes[attr].text
+            })
+
+        print("Creating {0} notes...".format(len(note_set)))
+        for note in note_set:
+            notes.append({
+                "NoteID": str(note),
+                "NoteText": self._notes[note].text,
+                "NoteColor": self._color_of_cell(self._notes[note])
+            })
+
+        print("Creating colormap...")
+        for i, k in self.colormap.iterrows():
+            add = {
+                "RGB": k['RGB'],
+                "ColorName": k['ColorName'],
+                "Score": k['Score']
+            }
+            colormap.append(add)
+
+        json_out = {
+            "colormap": colormap,
+            "questions": sorted(questions, key=lambda x: x['QuestionID']),
+            "targets": sorted(targets, key=lambda x: x['TargetID']),
+            "criteria": criteria,
+            "caveats": caveats,
+            "attributes": {
+                'nsUuid': str(self._attributes.get_ns_uuid()),
+                'Elements': sorted(attributes, key=lambda x: x['AttributeID'])
+            },
+            "notes": {
+                'nsUuid': str(self._attributes.get_ns_uuid()),
+                'Elements': sorted(notes, key=lambda x: x['NoteID'])
+            }
+        }
+        return json_out
+
+
+def serialize_rowwise(E):
+    """
+    Reference serializer: the original row-wise MsspDataStore.serialize(), run on E's content
+    :param E: an MsspDataStore
+    :return: the same dict as E.serialize()
+    """
+    return RowwiseStore(E).serialize()
+
+
+def element_set_rowwise(json_in, colormap=None):
+    """
+    Reference loader: SemanticElementSet.from_json() as one __setitem__ per element
+    :param json_in: the 'attributes' or 'notes' part of a snapshot
+    :param colormap: a Colormap, for notes
+    :return: a SemanticElementSet
+    """
+    the_set = SemanticElementSet(ns_uuid=json_in['nsUuid'], colormap=colormap)
+    for i in json_in['Elements']:
+        if colormap is None:
+            the_set[uuid.UUID(i['AttributeID'])] = SemanticElement(text=i['AttributeText'])
+        else:
+            the_set[uuid.UUID(i['NoteID'])] = SemanticElement(text=i['NoteText'],
+                                                              fill_color=colormap.rgb(i['NoteColor']))
+    return the_set
+
+
+def _same_elements(a, b):
+    return a.dups == b.dups and a._keys == b._keys and all(
+        (a[k].text, a[k].fill_color) == (b[k].text, b[k].fill_color) for k in a.keys())
+
+
+def _best_time(func, repeat):
+    """
+    Best wall time of repeat calls, with the callee's progress messages discarded
+    :return: (seconds, last result)
+    """
+    best = None
+    result = None
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeat):
+            sys.stdout = devnull
+            try:
+                start = time.time()
+                result = func()
+                elapsed = time.time() - start
+            finally:
+                sys.stdout = stdout
+            if best is None or elapsed < best:
+                best = elapsed
+    return best, result
+
+
+def bench_serialize(snapshot, repeat=5):
+    """
+    Time serialize() against the row-wise reference on an engine snapshot, after checking they agree.
+    :param snapshot: engine snapshot (JSON directory or file)
+    :param repeat: number of timed runs of each; the best is reported
+    :return: (vectorized seconds, row-wise seconds)
+    """
+    E = JsonImporter(snapshot)
+    reference = RowwiseStore(E)
+    fast, out = _best_time(E.serialize, repeat)
+    slow, ref = _best_time(reference.serialize, repeat)
+    if json.dumps(out, indent=4) != json.dumps(ref, indent=4):
+        raise AssertionError('serialize() output differs from the row-wise reference')
+    print('serialize: %d criteria, %d caveat rows' % (len(E._criteria), len(E._caveats)))
+    print('  vectorized: %8.1f ms' % (fast * 1000))
+    print('  row-wise:   %8.1f ms' % (slow * 1000))
+    print('  speedup:    %8.1fx' % (slow / fast))
+    return fast, slow
+
+
+def bench_element_sets(snapshot, repeat=5):
+    """
+    Time bulk loading of the attribute and note sets against the element-by-element reference, after checking
+    they agree.
+    :param snapshot: engine snapshot (JSON directory or file)
+    :param repeat: number of timed runs of each; the best is reported
+    :return: (bulk seconds, element-by-element seconds)
+    """
+    json_in = read_json(snapshot)
+    colormap = Colormap.from_json(json_in['colormap'])
+
+    def bulk():
+        return (SemanticElementSet.from_json(json_in['attributes']),
+                SemanticElementSet.from_json(json_in['notes'], colormap=colormap))
+
+    def rowwise():
+        return (element_set_rowwise(json_in['attributes']),
+                element_set_rowwise(json_in['notes'], colormap=colormap))
+
+    fast, out = _best_time(bulk, repeat)
+    slow, ref = _best_time(rowwise, repeat)
+    if not all(_same_elements(a, b) for a, b in zip(out, ref)):
+        raise AssertionError('bulk-loaded element sets differ from the reference')
+    print('element sets: %d attributes, %d notes' % (len(out[0]), len(out[1])))
+    print('  bulk:       %8.1f ms' % (fast * 1000))
+    print('  per-item:   %8.1f ms' % (slow * 1000))
+    print('  speedup:    %8.1fx' % (slow / fast))
+    return fast, slow
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time engine bulk operations on a snapshot.')
+    parser.add_argument('snapshot', help='engine snapshot (JSON directory or file)')
+    parser.add_argument('--repeat', '-r', type=int, default=5)
+    args = parser.parse_args()
+
+    bench_serialize(os.path.abspath(args.snapshot), repeat=args.repeat)
+    bench_element_sets(os.path.abspath(args.snapshot), repeat=args.repeat)
@@ -0,0 +1,159 @@
+"""
+The colormap: the note fill colors (RGB strings like 'FFFF0000'), their names, and their scores.
+
+Notes carry only an RGB; everything else about a color is looked up in the colormap.  A Colormap is built once,
+from colormap.json or from the spreadsheet's COLORMAP sheet, and is immutable, so the note set, the data store and
+the scoring engine can share one instance.  To change colors, build a new Colormap and hand it to
+MsspDataStore.set_colormap(); the notes keep their RGBs and are read through the new map.
+
+Where a name or RGB appears more than once, the first row wins, as the DataFrame lookups this replaces did.
+"""
+
+import pandas as pd
+
+from MSSP.exceptions import MsspError
+
+
+columns = ('RGB', 'ColorName', 'Score')
+
+
+class Colormap(object):
+    """
+    Internals:
+        obj._rgbs, obj._names, obj._scores = tuples of the column values, in row order
+        obj._code[rgb] = first row index with that RGB
+        obj._by_name[name] = first row index with that name
+    """
+    __slots__ = ('_rgbs', '_names', '_scores', '_code', '_by_name')
+
+    def __init__(self, rows):
+        """
+
+        :param rows: iterable of dicts with keys 'RGB', 'ColorName' and 'Score'
+        :return:
+        """
+        rows = list(rows)
+        code = dict()
+        by_name = dict()
+        for i, row in enumerate(rows):
+            code.setdefault(row['RGB'], i)
+            by_name.setdefault(row['ColorName'], i)
+        set_ = super(Colormap, self).__setattr__
+        set_('_rgbs', tuple(row['RGB'] for row in rows))
+        set_('_names', tuple(row['ColorName'] for row in rows))
+        set_('_scores', tuple(row['Score'] for row in rows))
+        set_('_code', code)
+        set_('_by_name', by_name)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        :param df: DataFrame with columns 'RGB', 'ColorName' and 'Score'
+        """
+        return cls(dict(zip(columns, values)) for values in zip(*[df[c].tolist() for c in columns]))
+
+    @classmethod
+    def from_json(cls, json_in):
+        """
+        :param json_in: the 'colormap' list from colormap.json
+        """
+        return cls(json_in)
+
+    @classmethod
+    def coerce(cls, colormap):
+        """
+        A Colormap from a Colormap, a DataFrame, or a list of row dicts
+        """
+        if colormap is None or isinstance(colormap, cls):
+            return colormap
+        if isinstance(colormap, pd.DataFrame):
+            return cls.from_frame(colormap)
+        return cls(colormap)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Colormap is immutable')
+
+    def __len__(self):
+        return len(self._rgbs)
+
+    def __contains__(self, rgb):
+        return rgb in self._code
+
+    def __iter__(self):
+        """
+        Rows as dicts, in row order
+        """
+        for row in zip(self._rgbs, self._names, self._scores):
+            yield dict(zip(columns, row))
+
+    def __getitem__(self, column):
+        """
+        A column as a Series, as if the colormap were a DataFrame
+        """
+        return self.to_frame()[column]
+
+    def __eq__(self, other):
+        return isinstance(other, Colormap) and (self._rgbs, self._names, self._scores) == \
+            (other._rgbs, other._names, other._scores)
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def rgbs(self):
+        return self._rgbs
+
+    @property
+    def names(self):
+        return self._names
+
+    @property
+    def scores(self):
+        return self._scores
+
+    def code(self, rgb):
+        """
+        Row index of an RGB
+        """
+        try:
+            return self._code[rgb]
+        except KeyError:
+            raise MsspError('Fill color %s is not in the colormap' % rgb)
+
+    def name(self, rgb):
+        """
+        Color name of an RGB
+        """
+        return self._names[self.code(rgb)]
+
+    def rgb(self, name):
+        """
+        RGB of a color name
+        """
+        try:
+            return self._rgbs[self._by_name[name]]
+        except KeyError:
+            raise KeyError('Key %s was not found in colormap column ColorName' % name)
+
+    def score(self, name):
+        """
+        Score of a color name
+        """
+        try:
+            return self._scores[self._by_name[name]]
+        except KeyError:
+            raise KeyError('Key %s was not found in colormap column ColorName' % name)
+
+    def missing(self, rgbs):
+        """
+        The RGBs not in the colormap
+        :param rgbs: iterable of RGB strings
+        :return: sorted list
+        """
+        return sorted(set(rgb for rgb in rgbs if rgb not in self._code))
+
+    def to_frame(self):
+        return pd.DataFrame(list(self), columns=list(columns))
+
+    def to_json(self):
+        return list(self)
@@ -0,0 +1,73 @@
+"""
+Vectorized decoding of the data store's integer-coded tables into display form.
+
+The criteria and caveats tables hold answer indices and note codes.  To show them, each (QuestionID, answer
+index) pair is replaced by the answer text and each note code by the note text.  Rather than look these up one
+row at a time, a DecodedViews object lays out every question's valid answers end to end in one flat array, with
+per-question offsets, and every note's text in an array indexed by code.  A whole column then decodes with a
+single fancy-indexing step.
+"""
+
+import numpy as np
+
+from MSSP.interning import UNPARSED
+
+
+class DecodedViews(object):
+    """
+    Decoding tables for one version of an MsspDataStore.
+
+    Internals:
+        obj._answers = object array of all valid answers, question by question, then a trailing None
+        obj._offsets[q] = position of question q's first answer in obj._answers
+        obj._counts[q] = number of valid answers to question q
+        obj._notes = object array of note texts by note code, then a trailing None
+    """
+    def __init__(self, questions, notes, note_codes):
+        """
+
+        :param questions: the question enum of an MsspDataStore
+        :param notes: the note SemanticElementSet
+        :param note_codes: the UuidInterner for NoteIDs
+        :return:
+        """
+        self._counts = np.array([0 if q is None else len(q.valid_answers) for q in questions], dtype=int)
+        self._offsets = np.concatenate(([0], np.cumsum(self._counts)[:-1])).astype(int)
+        total = int(self._counts.sum())
+        self._answers = np.empty(total + 1, dtype=object)
+        k = 0
+        for q in questions:
+            if q is not None:
+                for a in q.valid_answers:
+                    self._answers[k] = a
+                    k += 1
+        self._answers[total] = None
+
+        codes = len(note_codes)
+        self._notes = np.empty(codes + 1, dtype=object)
+        for c in range(codes):
+            self._notes[c] = notes[note_codes.uuid(c)].text
+        self._notes[codes] = None
+
+    def answers(self, questions, indices):
+        """
+        Answer text for parallel arrays of QuestionIDs and answer indices.  UNPARSED or out-of-range indices
+        decode to None.
+        :param questions: int array-like
+        :param indices: int array-like
+        :return: object array
+        """
+        questions = np.asarray(questions, dtype=int)
+        indices = np.asarray(indices, dtype=int)
+        valid = (indices != UNPARSED) & (indices >= 0) & (indices < self._counts[questions])
+        positions = np.where(valid, self._offsets[questions] + indices, len(self._answers) - 1)
+        return self._answers[positions]
+
+    def notes(self, codes):
+        """
+        Note text for an array of note codes.  UNPARSED decodes to None.
+        :param codes: int array-like
+        :return: object array
+        """
+        codes = np.asarray(codes, dtype=int)
+        return self._notes[np.where(codes == UNPARSED, len(self._notes) - 1, codes)]
@@ -67,6 +67,7 @@ class Element(object):
     """
     A decorated text string that appears in the spreadsheet
     """
+    __slots__ = ('text', 'text_color', 'fill_color', 'ref')
 
     def __init__(self, text, text_color=0, fill_color='00000000', ref=None):
         self.text = text
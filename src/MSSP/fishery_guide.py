@@ -7,7 +7,9 @@ from __future__ import print_function
 from eight import input
 from MSSP.utils import ifinput, defaultdir
 from MSSP import selectors
-from collections import defaultdict
+from MSSP.exceptions import MsspError
+from MSSP.scoring import UNANSWERED, IncrementalScorer, CriteriaScheduler
+from MSSP.json_exch import write_guide_lines
 import os
 import json
 
@@ -74,10 +76,20 @@ class FisheryGuide(object):
             filename = os.path.join(filename, default_file)
         return os.path.normpath(filename)
 
-    def __init__(self, mssp_engine, filename=None):
+    def __init__(self, mssp_engine, filename=None, interactive=True):
+        """
+
+        :param mssp_engine: an MsspDataStore
+        :param filename: answers file (absolute, or relative to defaultdir)
+        :param interactive: (default True) prompt for missing answers.  If False, questions that would require a
+         prompt are left unanswered and recorded in self.unanswered, and unanswered criteria are failed.
+        """
         self._engine = mssp_engine
         self._answers = dict()  # we want to use UUIDs someday
         self._qualifying_targets = dict()
+        self.interactive = interactive
+        self.unanswered = set()
+        self._incremental = None  # IncrementalScorer, created by the first set_answer()
 
         if filename is None:
             filename = defaultdir
@@ -90,20 +102,27 @@ class FisheryGuide(object):
         :return:
         """
         q = self._engine.questions(question)[0]
-        if len(q.satisfied_by) > 0:
-            print('Question %d is satisfied by others:' % question)
-            for i in q.satisfied_by:
-                if i not in self._answers:
+        graph = self._engine.satisfied_by_graph()
+        if graph.is_derived(question):
+            if self.interactive:
+                print('Question %d is satisfied by others:' % question)
+            for i in graph.base_questions(question):
+                if i not in self._answers and i not in self.unanswered:
                     self.answer(i)  # on satisfying questions, only prompt for missing q's
-            self._answers[question] = max([self._answers[i] for i in q.satisfied_by])
-            """
-            note the 'SatisfiedBy' motif requires all satisfiers and the satisfied to have
-            the same set + sequence of valid_answers. This has been verified manually but is not enforced
-            structurally ....
-            """
+            # the graph guarantees that satisfiers share valid_answers; derive in dependency order
+            for i in graph.lineage(question):
+                derived = graph.derive(i, self._answers)
+                if derived is not None and derived != self._answers.get(i):
+                    self._record_answer(i, derived)
+            if question not in self._answers:
+                self.unanswered.add(question)
+                return
 
         elif len(q.valid_answers) == 1:
-            self._answers[question] = 0
+            self._record_answer(question, 0)
+        elif not self.interactive:
+            self.unanswered.add(question)
+            return
         else:
             choice = None
             self._engine.show(question=question)
@@ -116,10 +135,54 @@ class FisheryGuide(object):
                 if choice not in range(len(q.valid_answers)):
                     print('Value out of range!')
 
-            self._answers[question] = choice
+            self._record_answer(question, choice)
+
+        self.unanswered.discard(question)
+        if self.interactive:
+            print('QuestionID %d: answered %s\n' % (question,
+                                                    q.valid_answers[self._answers[question]]))
+
+    def _record_answer(self, question, answer):
+        if self._incremental is None:
+            self._answers[question] = answer
+        else:
+            self.set_answer(question, answer)
+
+    def _tracker(self):
+        scoring = self._scoring()
+        if self._incremental is None or self._incremental.scoring is not scoring:
+            self._incremental = IncrementalScorer(scoring, self._answers)
+        return self._incremental
 
-        print('QuestionID %d: answered %s\n' % (question,
-                                                q.valid_answers[self._answers[question]]))
+    def _set_one(self, tracker, question, answer, deltas):
+        if answer == UNANSWERED:
+            self._answers.pop(question, None)
+        else:
+            self._answers[question] = answer
+        deltas.append(tracker.set_answer(question, answer))
+        # re-derive only the questions downstream of this one
+        for s, derived in self._engine.satisfied_by_graph().propagate(self._answers, question):
+            deltas.append(tracker.set_answer(s, UNANSWERED if derived is None else derived))
+
+    def set_answer(self, question, answer):
+        """
+        Change a single answer without re-running the guide.  Only the targets linked to the question (and to any
+        questions it satisfies) are re-evaluated; qualifying sets already computed by filter() are updated in place.
+        :param question: QuestionID
+        :param answer: answer index, or UNANSWERED to clear the answer
+        :return: an answerDelta: questions changed, TargetIDs that entered and left the qualifying set, and a dict of
+         TargetID: (old score, new score) for targets whose caveat score moved
+        """
+        tracker = self._tracker()
+        deltas = []
+        self._set_one(tracker, question, answer, deltas)
+        delta = IncrementalScorer.merge_deltas(deltas)
+
+        scoring = tracker.scoring
+        for sel, targets in self._qualifying_targets.items():
+            targets.update(t for t in delta.entered if scoring.sel_mask[sel][t])
+            targets.difference_update(delta.left)
+        return delta
 
     def my_answer(self, question, answer=None):
         if answer is None:
@@ -145,27 +208,29 @@ class FisheryGuide(object):
 
     def _print_target_criteria(self, criteria):
         for c in criteria:
-            if c['Pass']:
+            if c['Pass'] is None:
+                print('  --   - Question ID %3d [not evaluated; needs >= %s]' % (c['QuestionID'], c['Threshold']))
+            elif c['Pass']:
                 print(' pass  - Question ID %3d [%s >= %s]' % (c['QuestionID'], self.my_answer(c['QuestionID']),
                       c['Threshold']))
             else:
                 print('(FAIL) - Question ID %3d [%s < %s]' % (c['QuestionID'], self.my_answer(c['QuestionID']),
                       c['Threshold']))
 
+    def _scoring(self):
+        return self._engine.scoring_engine()
+
+    def _answer_vector(self):
+        return self._scoring().answer_vector(self._answers)
+
     def qualify_target(self, target):
         """
 
         :param target:
-        :return: a list of dicts for criteria, with keys: 'QuestionID', 'Answer', 'Threshold', 'Pass'
+        :return: a list of dicts for criteria, with keys: 'QuestionID', 'Answer', 'Threshold', 'Pass' ('Pass' is
+         None for questions that have not been answered)
         """
-        cri = self._engine.criteria_for_target(target)
-        criteria = []
-        for i, k in cri.iterrows():
-            criteria.append({'QuestionID': k['QuestionID'],
-                             'Answer': self.my_answer(k['QuestionID']),
-                             'Threshold': self.my_answer(k['QuestionID'], answer=k['Threshold']),
-                             'Pass': bool(self._answers[k['QuestionID']] >= k['Threshold'])})
-        return criteria
+        return self._scoring().qualify_target(self._answer_vector(), target)
 
     @staticmethod
     def _print_target_score(scores):
@@ -188,97 +253,189 @@ class FisheryGuide(object):
         :return: a dict of color keys containing lists of dicts for notes having that color, with keys
          'QuestionID', 'Answer', 'Note'
         """
-        cavs = self._engine.caveats_for_target(target)
-        scores = defaultdict(list)
-        for i, k in cavs.iterrows():
-            if k['Answer'] == self._answers[k['QuestionID']]:
-                note, color = self._engine.note(k['NoteID'])
-                scores[color].append({'QuestionID': k['QuestionID'],
-                                      'Answer': self.my_answer(k['QuestionID']),
-                                      'Note': note})
-        return dict(scores)
+        return self._scoring().score_target(self._answer_vector(), target)
 
     def _nonqualifying_targets(self, sel):
         if sel not in self._qualifying_targets:
             self.filter(sel)
         return set(self._engine.targets_for(sel)).difference(set(self._qualifying_targets[sel]))
 
-    @staticmethod
-    def _score_profile(scores):
-        score = 0
-        if 'green' in scores:
-            score += len(scores['green'])
-        if 'orange' in scores:
-            score -= len(scores['orange'])
-        if 'yellow' in scores:
-            score -= len(scores['yellow'])
-        if 'red' in scores:
-            score -= 10*len(scores['red'])
-        return score
+    def _score_profile(self, scores):
+        scoring = self._scoring()
+        return sum([scoring.color_score(color) * len(notes) for color, notes in scores.items()])
 
     def _profile(self, target):
-        profile = dict(TargetID=target, Title=self._engine.title(target=target))
-        profile['Criteria'] = sorted(self.qualify_target(target), key=lambda k: k['QuestionID'])
-        profile['Pass'] = bool(all([x['Pass'] for x in profile['Criteria']]))
-        if profile['Pass']:
-            profile['Caveats'] = self.score_target(target)
-            profile['Score'] = self._score_profile(profile['Caveats'])
-        return profile
+        return self._scoring().profile(self._answer_vector(), target)
+
+    def _profiles(self, targets):
+        """
+        Build profiles for a collection of targets, scoring all of them in one pass
+        :param targets:
+        :return: list of profile dicts, in the order given
+        """
+        scoring = self._scoring()
+        answers = self._answer_vector()
+        scores = scoring.scores(answers)
+        return [scoring.profile(answers, i, scores[i]) for i in targets]
 
-    def score_qualifying_targets(self, sel):
-        scores = []
+    def score_qualifying_targets(self, sel, lazy=False):
+        """
+
+        :param sel:
+        :param lazy: (default False) return a generator that builds each profile only when it is consumed
+        :return:
+        """
         if sel not in self._qualifying_targets:
             self.filter(sel)
-        for i in self._qualifying_targets[sel]:
-            scores.append(self._profile(i))
+        if lazy:
+            scoring = self._scoring()
+            answers = self._answer_vector()
+            scores = scoring.scores(answers)
+            targets = sorted(self._qualifying_targets[sel], key=lambda i: (scores[i], i))
+            return (self._check_scored(scoring.profile(answers, i, scores[i])) for i in targets)
+        scores = [self._check_scored(p) for p in self._profiles(sorted(self._qualifying_targets[sel]))]
         return sorted(scores, key=lambda x: x['Score'])
 
-    def score_nonqualifying_targets(self, sel):
-        scores = []
-        for i in self._nonqualifying_targets(sel):
-            scores.append(self._profile(i))
-        return scores
+    @staticmethod
+    def _check_scored(profile):
+        """
+        A qualifying target's profile must pass its criteria and carry a score; anything else means filter() and
+        the scoring engine disagree about the target.
+        """
+        if 'Score' not in profile:
+            failed = [c['QuestionID'] for c in profile['Criteria'] if not c['Pass']]
+            raise MsspError('Qualifying target %d fails criteria on questions %s' % (profile['TargetID'], failed))
+        return profile
+
+    def score_nonqualifying_targets(self, sel, lazy=False):
+        """
+
+        :param sel:
+        :param lazy: (default False) return a generator that builds each profile only when it is consumed
+        :return:
+        """
+        targets = sorted(self._nonqualifying_targets(sel))
+        if lazy:
+            scoring = self._scoring()
+            answers = self._answer_vector()
+            scores = scoring.scores(answers)
+            return (scoring.profile(answers, i, scores[i]) for i in targets)
+        return self._profiles(targets)
+
+    def ranked_targets(self, sel, top_k=None, qualifying=True):
+        """
+        Iterate over target profiles best first.  Ranking uses the score and criteria-failure vectors only; a
+        profile dict is built for each target as it is yielded, so e.g. top_k=10 builds ten profiles.
+        :param sel: selector
+        :param top_k: (default None) yield at most this many targets
+        :param qualifying: (default True) rank the qualifying targets by descending score. If False, rank the
+         non-qualifying targets by fewest failed criteria (unanswered criteria are not counted), then descending score
+        :return: generator of profile dicts
+        """
+        if qualifying:
+            if sel not in self._qualifying_targets:
+                self.filter(sel)
+            targets = self._qualifying_targets[sel]
+        else:
+            targets = self._nonqualifying_targets(sel)
+        return self._scoring().ranked_profiles(self._answer_vector(), targets, qualifying=qualifying, top_k=top_k)
+
+    def answer_sensitivity(self, sel):
+        """
+        How each target's qualification and score would change under every alternative answer to every question
+        bearing on the selector.  See ScoringEngine.sensitivity for the fields of the result.
+        :param sel:
+        :return: an answerSensitivity
+        """
+        return self._scoring().sensitivity(self._answer_vector(), sel)
+
+    def show_sensitivity(self, sel, top=10):
+        """
+        Print the questions whose answers matter most: by number of targets that could enter or leave the
+        qualifying set, then by largest score change.
+        :param sel:
+        :param top: number of questions to list
+        :return:
+        """
+        sens = self.answer_sensitivity(sel)
+        flips = (sens.qualifying != 0).any(axis=1).sum(axis=1)
+        swing = abs(sens.scores).max(axis=2).max(axis=1)
+        order = sorted(range(len(sens.questions)), key=lambda i: (-flips[i], -swing[i], sens.questions[i]))
+        print('%s: questions that matter most' % sel)
+        for i in order[:top]:
+            q = int(sens.questions[i])
+            print('Question ID %3d: %3d targets can flip, score swing %3s  %-30.30s "%s"' % (
+                q, flips[i], swing[i], self.my_answer(q), self._engine.title(question=q)))
 
     def filter(self, sel=None):
         """
+        Determine the qualifying targets for a selector, asking criteria questions as needed.
+
+        for monitoring, every criterion is evaluated for every target; target must pass all.
+        solution set is the intersection of all passing sets.
+
+        for assessment, criteria only apply to certain targets- the ones that fail are
+        the set difference between all linked targets and all passing targets.
+        that set difference is excluded from the solution set.
+
+        no criteria for control_rules - all targets pass.
 
+        Answered questions are applied first.  Unanswered questions are then asked in order of how many remaining
+        candidates they could eliminate; questions that bear on no remaining candidate are not asked.  Derived
+        questions whose satisfiers have all been answered are then resolved without a prompt.  Criteria left
+        unanswered are reported as not evaluated (see qualify_target).
         :param sel:
         :return:
         """
         if sel is None:
             sel = get_selector()
-        qs = self._engine.criteria_for(sel)
-        targets = set(self._engine.targets_for(sel))
-        for q in qs:
-            if q not in self._answers:
+        scheduler = CriteriaScheduler(self._scoring(), sel, self._engine.criteria_for(sel))
+        for q in scheduler.pending.tolist():
+            if q in self._answers:
+                scheduler.apply(q, self._answers[q])
+
+        q = scheduler.next_question()
+        while q is not None:
+            if q not in self.unanswered:
+                self.answer(q)
+            scheduler.apply(q, self._answers.get(q, UNANSWERED))
+            q = scheduler.next_question()
+
+        self._resolve_derived(scheduler.pending.tolist())
+        for q in scheduler.pending.tolist():
+            if q in self._answers:
+                scheduler.apply(q, self._answers[q])
+
+        if not self.interactive:
+            # nobody will answer the rest: unanswered criteria fail
+            for q in scheduler.pending.tolist():
                 self.answer(q)
-            t_pass = set(self._engine.criteria(q, answer=self.my_answer(q)).index.tolist())
-            if sel == 'Monitoring':
-                """
-                for monitoring, every criterion is evaluated for every target; target must pass all
-                solution set is the intersection of all passing sets
-                """
-                targets = targets.intersection(t_pass)
-            elif sel == 'Assessment':
-                """
-                for assessment, criteria only apply to certain targets- the ones that fail are
-                the set difference between all linked targets and all passing targets.
-                that set difference is excluded from the solution set.
-                """
-                t_fail = set(self._engine.criteria(q).index.tolist()).difference(t_pass)
-                targets = targets.difference(t_fail)
-            elif sel == 'ControlRules':
-                # no criteria for control_rules - all targets pass
-                pass
-
-        self._qualifying_targets[sel] = targets
+                scheduler.apply(q, self._answers.get(q, UNANSWERED))
+
+        self._qualifying_targets[sel] = set(scheduler.qualifying())
+
+    def _resolve_derived(self, questions):
+        """
+        Record the answers to those of the given questions that are derived and whose base questions are all
+        answered.  No prompt is needed for these.
+        :param questions:
+        :return:
+        """
+        graph = self._engine.satisfied_by_graph()
+        ready = set()
+        for q in questions:
+            if graph.is_derived(q) and all(i in self._answers for i in graph.base_questions(q)):
+                ready.update(graph.lineage(q))
+        answers = dict(self._answers)
+        for q, value in graph.resolve(answers, [q for q in graph.order if q in ready]):
+            self._record_answer(q, value)
 
     def refine(self, sel=None):
         if sel is None:
             sel = get_selector()
         qs = self._engine.caveats_for(sel)
         for q in qs:
-            if q not in self._answers:
+            if q not in self._answers and q not in self.unanswered:
                 self.answer(q)
 
     def show_qualifying_targets(self, sel):
@@ -307,12 +464,42 @@ class FisheryGuide(object):
             'NonQualifyingTargets': self.score_nonqualifying_targets(sel)
         }
 
+    def stream_guide(self, sel=None, filename=None, compress=False, compact=False):
+        """
+        Like guide() followed by save_guide(), but the report is written as JSON Lines (one target profile per
+        line) and each profile is built just before it is written.  See json_exch.write_guide_lines.
+        :param sel:
+        :param filename: answers filename; the report is written alongside it as <name>.<selector>.jsonl[.gz]
+        :param compress: (default False) gzip the report
+        :param compact: (default False) omit whitespace between JSON tokens
+        :return: the report filename
+        """
+        if sel is None:
+            sel = get_selector()
+        self.filter(sel)
+        self.refine(sel)
+        report = {
+            'FisheryGuide': self.name(),
+            'Selector': sel,
+            'QualifyingTargets': self.score_qualifying_targets(sel, lazy=True),
+            'NonQualifyingTargets': self.score_nonqualifying_targets(sel, lazy=True)
+        }
+        filename = self.get_abs_path(filename)
+        guide_name = self.name() + '.' + sel.lower() + '.jsonl'
+        if compress:
+            guide_name += '.gz'
+        filename = os.path.join(os.path.dirname(filename), guide_name)
+        write_guide_lines(report, filename, compress=compress, compact=compact)
+        print('%s guide written to %s' % (sel, filename))
+        return filename
+
     def _export_answers(self):
         return {
             "answers": [{'QuestionID': k, 'Answer': v} for k, v in self._answers.items()]
         }
 
     def _import_answers(self, json_in):
+        self._incremental = None
         for a in json_in['answers']:
             self._answers[int(a['QuestionID'])] = int(a['Answer'])
 
@@ -337,3 +524,4 @@ class FisheryGuide(object):
         with open(filename, 'w') as fp:
             json.dump(guide, fp, indent=4)
         print('%s guide written to %s' % (guide['Selector'], filename))
+        return filename
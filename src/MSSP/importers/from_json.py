@@ -1,5 +1,6 @@
 from MSSP.mssp_data_store import MsspDataStore
 from MSSP.semantic_elements import SemanticElementSet
+from MSSP.colormap import Colormap
 from MSSP.mssp_objects import MsspQuestion, MsspTarget
 from MSSP.importers import indices
 from MSSP.json_exch import read_json
@@ -20,7 +21,7 @@ class JsonImporter(MsspDataStore):
 
         # first thing to do is build the attribute and note lists
 
-        colormap = pd.DataFrame(json_in['colormap'])
+        colormap = Colormap.from_json(json_in['colormap'])
         attribute_set = SemanticElementSet.from_json(json_in['attributes'])
         note_set = SemanticElementSet.from_json(json_in['notes'], colormap=colormap)
 
@@ -0,0 +1,102 @@
+from MSSP.mssp_data_store import MsspDataStore
+from MSSP.mssp_objects import MsspQuestion, MsspTarget
+from MSSP.colormap import Colormap
+from MSSP.sqlite_store import SqliteElementSet, db_path
+import os
+import json
+import sqlite3
+import uuid
+
+import pandas as pd
+
+
+class SqliteImporter(MsspDataStore):
+
+    def __init__(self, file_ref):
+        """
+        Constructs an MsspDataStore object from a snapshot database written by sqlite_store.write_sqlite.  Element
+        text is read from the database as it is needed, so the connection stays open for the life of the object.
+        :param file_ref: database file
+        :return: an MsspDataStore
+        """
+        filename = db_path(file_ref)
+        if not os.path.exists(filename):
+            raise IOError("File not found: {0}".format(filename))
+        self._db = sqlite3.connect(filename)
+        db = self._db
+
+        meta = dict(db.execute('SELECT key, value FROM meta'))
+        colormap = Colormap(dict(zip(('RGB', 'ColorName', 'Score'), r)) for r in
+                            db.execute('SELECT RGB, ColorName, Score FROM colormap ORDER BY seq'))
+        attribute_set = SqliteElementSet(db, 'attributes', ns_uuid=meta['attributes_ns'])
+        note_set = SqliteElementSet(db, 'notes', ns_uuid=meta['notes_ns'], colormap=colormap)
+
+        question_rows = db.execute('SELECT QuestionID, Title, Category, ValidAnswers, Refs, SatisfiedBy '
+                                   'FROM questions ORDER BY QuestionID').fetchall()
+        target_rows = db.execute('SELECT TargetID, Title, Category, Reference '
+                                 'FROM targets ORDER BY TargetID').fetchall()
+
+        question_enum = [None] * (1 + max([r[0] for r in question_rows]))
+        target_enum = [None] * (1 + max([r[0] for r in target_rows]))
+
+        for q_index, title, category, valid_answers, refs, satisfied_by in question_rows:
+            q = {
+                "ValidAnswers": json.loads(valid_answers),
+                "References": json.loads(refs)
+            }
+            if title is not None:
+                q["Title"] = title
+            if category is not None:
+                q["Category"] = category
+            if satisfied_by is not None:
+                q["SatisfiedBy"] = json.loads(satisfied_by)
+            question_enum[q_index] = MsspQuestion.from_json(q)
+
+        for t_index, title, category, reference in target_rows:
+            t = {"Reference": json.loads(reference)}
+            if title is not None:
+                t["Title"] = title
+            if category is not None:
+                t["Category"] = category
+            target_enum[t_index] = MsspTarget.from_json(t)
+
+        # create pandas tables
+        rows = db.execute('SELECT QuestionID, AttributeID FROM question_attributes ORDER BY seq').fetchall()
+        question_attributes = pd.DataFrame(
+            {
+                "QuestionID": [r[0] for r in rows],
+                "AttributeID": [uuid.UUID(r[1]) for r in rows]
+            }
+            ).drop_duplicates()
+
+        rows = db.execute('SELECT TargetID, AttributeID FROM target_attributes ORDER BY seq').fetchall()
+        target_attributes = pd.DataFrame(
+            {
+                "TargetID": [r[0] for r in rows],
+                "AttributeID": [uuid.UUID(r[1]) for r in rows]
+            }
+        )
+
+        rows = db.execute('SELECT QuestionID, Threshold, TargetID FROM criteria ORDER BY seq').fetchall()
+        criteria = pd.DataFrame(
+            {
+                "QuestionID": [r[0] for r in rows],
+                "Threshold": [r[1] for r in rows],
+                "TargetID": [r[2] for r in rows]
+            }
+        )
+
+        rows = db.execute('SELECT QuestionID, TargetID, Answer, NoteID FROM caveats ORDER BY seq').fetchall()
+        caveats = pd.DataFrame(
+            {
+                "QuestionID": [r[0] for r in rows],
+                "TargetID": [r[1] for r in rows],
+                "Answer": [r[2] for r in rows],
+                "NoteID": [uuid.UUID(r[3]) for r in rows]
+            }
+        )
+
+        super(SqliteImporter, self).__init__(
+            attribute_set, note_set, question_enum, target_enum,
+            question_attributes, target_attributes, criteria, caveats,
+            colormap)
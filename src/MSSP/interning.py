@@ -0,0 +1,115 @@
+"""
+Integer coding for the data store's tables.
+
+The importers build the mapping tables with uuid.UUID objects in the AttributeID and NoteID columns, and leave
+None in the Threshold and Answer columns wherever an answer string could not be parsed.  That gives object- or
+float-dtype columns.  MsspDataStore re-codes each table once, on construction:
+
+ - UUID columns become dense int32 codes, with a UuidInterner per element set as the side table;
+ - QuestionID and TargetID columns become int32;
+ - Threshold and Answer columns become int16, with UNPARSED in place of None.
+
+UUIDs are decoded again only at the edges: printing, search results, and serialization.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+UNPARSED = -1  # sentinel for an answer index, or UUID code, that could not be determined
+
+code_dtype = np.int32
+id_dtype = np.int32
+answer_dtype = np.int16
+
+
+class UuidInterner(object):
+    """
+    Bijection between UUIDs and dense int32 codes, assigned in order of first appearance.
+    """
+    def __init__(self, uuids=()):
+        self._uuids = []
+        self._codes = dict()
+        for u in uuids:
+            self.intern(u)
+
+    def __len__(self):
+        return len(self._uuids)
+
+    def __contains__(self, item):
+        return item in self._codes
+
+    def intern(self, uuid):
+        """
+        Code for a UUID, assigning a new one if it has not been seen
+        """
+        try:
+            return self._codes[uuid]
+        except KeyError:
+            code = len(self._uuids)
+            self._uuids.append(uuid)
+            self._codes[uuid] = code
+            return code
+
+    def code(self, uuid):
+        """
+        Code for a UUID, or UNPARSED if it has not been interned
+        """
+        return self._codes.get(uuid, UNPARSED)
+
+    def encode(self, uuids):
+        """
+        Intern a sequence of UUIDs (None becomes UNPARSED)
+        :return: int32 array of codes
+        """
+        return np.array([UNPARSED if u is None else self.intern(u) for u in uuids], dtype=code_dtype)
+
+    def lookup(self, uuids):
+        """
+        Codes of a sequence of UUIDs, without interning; unknown UUIDs are dropped
+        :return: int32 array of codes
+        """
+        return np.array([c for c in (self.code(u) for u in uuids) if c != UNPARSED], dtype=code_dtype)
+
+    def uuid(self, code):
+        """
+        UUID for a code, or None for UNPARSED
+        """
+        if code == UNPARSED:
+            return None
+        return self._uuids[code]
+
+    def decode(self, codes):
+        """
+        List of UUIDs for a sequence of codes
+        """
+        return [self.uuid(c) for c in codes]
+
+
+def answer_column(values):
+    """
+    Fixed-width answer index column, with nulls replaced by UNPARSED
+    """
+    return pd.Series(values).fillna(UNPARSED).values.astype(answer_dtype)
+
+
+def intern_table(table, interners=None, ids=('QuestionID', 'TargetID'), answers=('Threshold', 'Answer')):
+    """
+    Re-code a mapping table as described in the module docstring.  Columns not present are skipped.
+    :param table: DataFrame as built by an importer
+    :param interners: dict of column name: UuidInterner for UUID columns
+    :param ids: integer ID columns
+    :param answers: answer index columns
+    :return: a new DataFrame with the same index and column order
+    """
+    coded = table.copy()
+    for column, interner in (interners or dict()).items():
+        if column in coded:
+            coded[column] = interner.encode(coded[column].tolist())
+    for column in ids:
+        if column in coded:
+            coded[column] = coded[column].values.astype(id_dtype)
+    for column in answers:
+        if column in coded:
+            coded[column] = answer_column(coded[column].values)
+    return coded
@@ -74,3 +74,102 @@ def read_json(json_in):
         fp.close()
 
     return json_out
+
+
+guide_sections = ('QualifyingTargets', 'NonQualifyingTargets')
+
+
+def _lines_path(filename):
+    import os
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(defaultdir, filename)
+
+
+def _open_lines(filename, mode, compress):
+    import gzip
+    if compress:
+        return gzip.open(filename, mode + 'b')
+    return open(filename, mode)
+
+
+def write_guide_lines(guide, filename, compress=None, compact=False):
+    """
+    Stream a guide report to a JSON Lines file: a header line holding the report's scalar fields (FisheryGuide,
+    Selector), then one line per target profile.  Each profile line carries a 'Section' key naming the list it
+    belongs to ('QualifyingTargets' or 'NonQualifyingTargets').  The profile lists may be any iterables,
+    including generators; each profile is written as soon as it is drawn, so the report is never held in memory.
+    :param guide: a guide report, as returned by FisheryGuide.guide()
+    :param filename: output file (absolute, or relative to defaultdir)
+    :param compress: write a gzip stream (default: if filename ends in '.gz')
+    :param compact: (default False) omit whitespace between JSON tokens
+    :return: number of profiles written
+    """
+    import json
+    filename = _lines_path(filename)
+    if compress is None:
+        compress = filename.endswith('.gz')
+    if compact:
+        separators = (',', ':')
+    else:
+        separators = None
+
+    count = 0
+    with _open_lines(filename, 'w', compress) as fp:
+        header = dict((k, v) for k, v in guide.items() if k not in guide_sections)
+        fp.write(json.dumps(header, separators=separators) + '\n')
+        for section in guide_sections:
+            for profile in guide.get(section, []):
+                line = dict(profile)
+                line['Section'] = section
+                fp.write(json.dumps(line, separators=separators) + '\n')
+                count += 1
+    return count
+
+
+def read_guide_lines(filename, compress=None):
+    """
+    Open a JSON Lines guide report written by write_guide_lines.  The header is read immediately; profiles are
+    parsed one line at a time as the returned generator is consumed.
+    :param filename: report file (absolute, or relative to defaultdir)
+    :param compress: read a gzip stream (default: if filename ends in '.gz')
+    :return: (header, profiles) where header is a dict and profiles generates (section, profile) tuples
+    """
+    import os
+    import json
+    filename = _lines_path(filename)
+    if not os.path.exists(filename):
+        raise IOError("File not found: {0}".format(filename))
+    if compress is None:
+        compress = filename.endswith('.gz')
+
+    fp = _open_lines(filename, 'r', compress)
+    header = json.loads(fp.readline())
+
+    def _profiles():
+        try:
+            for line in fp:
+                if line.strip() == '':
+                    continue
+                profile = json.loads(line)
+                yield profile.pop('Section'), profile
+        finally:
+            fp.close()
+
+    return header, _profiles()
+
+
+def load_guide_lines(filename, compress=None):
+    """
+    Read a JSON Lines guide report back into the dict form returned by FisheryGuide.guide()
+    :param filename:
+    :param compress:
+    :return:
+    """
+    header, profiles = read_guide_lines(filename, compress=compress)
+    guide = dict(header)
+    for section in guide_sections:
+        guide[section] = []
+    for section, profile in profiles:
+        guide.setdefault(section, []).append(profile)
+    return guide
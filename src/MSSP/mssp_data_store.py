@@ -30,18 +30,31 @@ Questions = collection of Attributes and valid answer strings (default to Yes/No
 
 """
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from copy import copy
 from uuid import UUID
 # from numpy import isnan
 
 from MSSP.utils import convert_reference_to_subject, check_sel, selectors, ifinput
 from MSSP.exceptions import MsspError
 from MSSP.importers import indices
-
-from pandas import MultiIndex
+from MSSP.scoring import ScoringEngine
+from MSSP.satisfied_by import SatisfiedByGraph
+from MSSP.row_index import RowIndex
+from MSSP.near_duplicates import DuplicateCluster
+from MSSP.colormap import Colormap
+from MSSP.attribute_index import AttributeIndex
+from MSSP.interning import UNPARSED, UuidInterner, intern_table, code_dtype, id_dtype
+from MSSP.transactions import UndoLog
+from MSSP.decoded_views import DecodedViews
+
+import numpy as np
+from pandas import MultiIndex, DataFrame, concat
 
 searchAttributes = namedtuple('searchAttributes', ['attributes', 'questions', 'targets'])
 searchNotes = namedtuple('searchNotes', ['notes', 'questions', 'targets'])
+selectorCatalog = namedtuple('selectorCatalog', ['targets', 'criteria', 'caveats'])
 
 
 class MsspDataStore(object):
@@ -67,7 +80,7 @@ class MsspDataStore(object):
         :param target_attributes: a DataFrame linking Targets and Attributes
         :param criteria: a DataFrame linking QuestionID, TargetID, answer, NoteID, score
         :param caveats: a DataFrame linking QuestionID, TargetID, threshold
-        :param colormap: a DataFrame mapping RGB colors to names and scores
+        :param colormap: a Colormap (or DataFrame) mapping RGB colors to names and scores
         :return:
         """
         self._attributes = attribute_set
@@ -75,16 +88,49 @@ class MsspDataStore(object):
         self._questions = question_enum
         self._targets = target_enum
 
-        self._question_attributes = question_attributes
-        self._target_attributes = target_attributes
+        # tables hold int codes for AttributeIDs and NoteIDs; these are the side tables
+        self._attr_codes = UuidInterner()
+        self._note_codes = UuidInterner()
+
+        # row labels are numbered afresh and never reused: the undo log refers to rows by label
+        self._question_attributes = intern_table(question_attributes,
+                                                 {'AttributeID': self._attr_codes}).reset_index(drop=True)
+        self._target_attributes = intern_table(target_attributes,
+                                               {'AttributeID': self._attr_codes}).reset_index(drop=True)
+        self._next_label = {
+            '_question_attributes': len(self._question_attributes),
+            '_target_attributes': len(self._target_attributes)
+        }
+        # attribute code <-> record lookups; every edit to the mapping tables must update these
+        self._attr_index = {
+            'question': AttributeIndex(self._question_attributes, 'QuestionID'),
+            'target': AttributeIndex(self._target_attributes, 'TargetID')
+        }
+        self._attr_edits = None  # pending mapping edits while inside batch_edits()
+        self._batch_depth = 0
 
-        self._criteria = criteria
-        self._caveats = caveats
+        self._criteria = intern_table(criteria).reset_index(drop=True)
+        self._caveats = intern_table(caveats, {'NoteID': self._note_codes}).reset_index(drop=True)
+        # row positions by QuestionID and TargetID; every edit that adds, drops or re-keys rows must update these
+        self._cri_index = RowIndex(self._criteria)
+        self._cav_index = RowIndex(self._caveats)
 
         # compute 'satisfies' list from 'satisfied_by'
         [self._set_satisfies(k) for k in range(len(self._questions))]
+        # and reject cycles or mismatched answers up front
+        self._satisfied_by_graph = SatisfiedByGraph(self._questions)
+
+        self._colormap = Colormap.coerce(colormap)  # shared with the note set; swap it with set_colormap()
+        self._notes.set_colormap(self._colormap, check=False)
 
-        self.colormap = colormap  # let the user manipulate the colormap directly
+        self._scoring = None  # compiled lazily by scoring_engine()
+
+        self._version = 0  # bumped on every content edit
+        self._undo = UndoLog()  # inverse operations of answer and question edits
+        self._catalogs = dict()  # sel: (version, selectorCatalog)
+        self._decoded = None  # (version, DecodedViews)
+        self.catalog_hits = 0
+        self.catalog_misses = 0
 
     def _set_satisfies(self, satisfied_by):
         """
@@ -99,21 +145,70 @@ class MsspDataStore(object):
                 for q in sb:
                     self._questions[q].satisfies.add(satisfied_by)
 
-    def _replace_field_with_answer(self, df, field='Threshold'):
+    @property
+    def version(self):
+        """
+        Edit counter: changes whenever the content of the data store does
+        """
+        return self._version
+
+    def _bump_version(self):
+        """
+        Record a content edit.  Cached selector catalogs from earlier versions are recomputed on next use.
+        :return:
+        """
+        self._version += 1
+
+    def _invalidate_compiled(self):
+        """
+        Discard the compiled ScoringEngine and SatisfiedByGraph after a change to questions, criteria or caveats
+        :return:
         """
+        self._bump_version()
+        self._scoring = None
+        self._satisfied_by_graph = None
 
+    def satisfied_by_graph(self):
+        """
+        Return the SatisfiedByGraph for the current questions, recompiling it after edits.  Raises MsspError if
+        the satisfied_by relation has become cyclic or inconsistent.
+        :return: a SatisfiedByGraph
+        """
+        if self._satisfied_by_graph is None:
+            self._satisfied_by_graph = SatisfiedByGraph(self._questions)
+        return self._satisfied_by_graph
+
+    def scoring_engine(self):
+        """
+        Return a ScoringEngine compiled from the current criteria and caveats.  The engine is cached until the
+        next content edit or colormap change.
+        :return: a ScoringEngine
+        """
+        if self._scoring is None:
+            self._scoring = ScoringEngine(self)
+        return self._scoring
+
+    def decoded_views(self):
+        """
+        Return the answer and note text tables for the current version, rebuilding them after edits
+        :return: a DecodedViews
+        """
+        if self._decoded is None or self._decoded[0] != self._version:
+            self._decoded = (self._version, DecodedViews(self._questions, self._notes, self._note_codes))
+        return self._decoded[1]
+
+    def _replace_field_with_answer(self, df, field='Threshold'):
+        """
+        Replace an answer index column with the answer text, as 'AnswerValue'
         :param df:
         :param field:
         :return:
         """
-        def lookup(rec):
-            return self._questions[rec['QuestionID']].valid_answers[rec[field]]
-
-        df['AnswerValue'] = df.apply(lookup, axis=1, reduce=True)
+        df['AnswerValue'] = self.decoded_views().answers(df['QuestionID'].values, df[field].values)
         df.drop(field, axis=1, inplace=True)
 
     def _replace_note_id_with_note(self, df):
-        df['Note'] = df['NoteID'].map(lambda x: self._notes[x].text)
+        df['Note'] = self.decoded_views().notes(df['NoteID'].values)
         df.drop('NoteID', axis=1, inplace=True)
 
     def _make_attr_list(self, index, record='question'):
@@ -123,15 +218,9 @@ class MsspDataStore(object):
         :param index:
         :return:
         """
-        if record == 'question':
-            mapping = self._question_attributes
-            key = 'QuestionID'
-        elif record == 'target':
-            mapping = self._target_attributes
-            key = 'TargetID'
-        else:
+        if record not in self._attr_index:
             raise MsspError('Invalid record specifier %s' % record)
-        return mapping.loc[mapping[key] == index, 'AttributeID'].tolist()
+        return self._attr_codes.decode(self._attr_index[record].attributes(index))
 
     def _print_attributes(self, index, record='question'):
         attr_keys = self._make_attr_list(index, record=record)
@@ -157,20 +246,40 @@ class MsspDataStore(object):
 
         return attr_keys
 
+    @property
+    def colormap(self):
+        return self._colormap
+
+    @colormap.setter
+    def colormap(self, colormap):
+        self.set_colormap(colormap)
+
+    def set_colormap(self, colormap):
+        """
+        Swap in a new colormap, e.g. with different color names or scores.  Notes keep their fill colors, which
+        must all appear in the new colormap; the scoring engine is recompiled on next use.
+        :param colormap: a Colormap, or a DataFrame or list of rows to build one from
+        :return:
+        """
+        colormap = Colormap.coerce(colormap)
+        self._notes.set_colormap(colormap)
+        self._colormap = colormap
+        self._invalidate_compiled()
+
     def _color_of_cell(self, element):
         """
         Return the color encoded by the element's fill_color
         :param element:
         :return:
         """
-        return self.colormap[self.colormap['RGB'] == element.fill_color]['ColorName'].iloc[0]
+        return self._colormap.name(element.fill_color)
 
     def _cri_for_record(self, index, record='question', answer=None):
         fieldname = {
             'question': 'QuestionID',
             'target': 'TargetID'
         }[record]
-        criteria = self._criteria[self._criteria[fieldname] == index].copy()
+        criteria = self._criteria.iloc[self._cri_index.rows(fieldname, index)].copy()
         # TODO: make this return 'satisfies' entries as well
         if answer is not None:
             if record == 'target':
@@ -192,7 +301,7 @@ class MsspDataStore(object):
             'question': 'QuestionID',
             'target': 'TargetID'
         }[record]
-        caveats = self._caveats[self._caveats[fieldname] == index].copy()
+        caveats = self._caveats.iloc[self._cav_index.rows(fieldname, index)].copy()
         self._replace_field_with_answer(caveats, field='Answer')
         if answer is not None:
             if record == 'target':
@@ -226,7 +335,7 @@ class MsspDataStore(object):
         obj.criteria = None
         obj.caveats = None
         print(obj)
-        criteria = self._criteria[self._criteria[fieldname] == index].copy()
+        criteria = self._criteria.iloc[self._cri_index.rows(fieldname, index)].copy()
         if len(criteria) > 0:
             self._replace_field_with_answer(criteria)
             print('Has Criteria:')
@@ -349,25 +458,137 @@ class MsspDataStore(object):
             print 'NoteID %s [%s]: %s' % (i, self._color_of_cell(n), n.text)
 
     def questions_with_attribute(self, index):
-        qs = set([v['QuestionID'] for k, v in self._question_attributes.iterrows() if v['AttributeID'] == index])
-        return sorted(list(qs))
+        return self._attr_index['question'].records(self._attr_codes.code(index))
 
     def targets_with_attribute(self, index):
-        ts = set([v['TargetID'] for k, v in self._target_attributes.iterrows() if v['AttributeID'] == index])
-        return sorted(list(ts))
-
-    def remap_duplicate_attribute_references(self):
-        for dup, orig in self._attributes.dups:
-            self._question_attributes.loc[self._question_attributes['AttributeID'] == dup, 'AttributeID'] = orig
-            self._target_attributes.loc[self._target_attributes['AttributeID'] == dup, 'AttributeID'] = orig
-
-    def _find_attr_map(self, mapping, r_index, attr):
-        if mapping is self._question_attributes:
-            return (mapping['AttributeID'] == attr) & (mapping['QuestionID'] == r_index)
-        elif mapping is self._target_attributes:
-            return (mapping['AttributeID'] == attr) & (mapping['TargetID'] == r_index)
-        else:
-            raise MsspError('Unknown mapping')
+        return self._attr_index['target'].records(self._attr_codes.code(index))
+
+    def _attr_references(self, attr):
+        """
+        Number of questions and targets mapped to an attribute
+        """
+        code = self._attr_codes.code(attr)
+        if code == UNPARSED:
+            return 0
+        return sum(len(index.records(code)) for index in self._attr_index.values())
+
+    def near_duplicate_attributes(self, threshold=0.8, **kwargs):
+        """
+        Clusters of attributes whose texts are nearly the same (see SemanticElementSet.near_duplicates).  Each
+        cluster lists its most-referenced attribute first; that is the one kept if the cluster is passed to
+        remap_duplicate_attribute_references.
+        :param threshold: minimum similarity
+        :param kwargs: passed to near_duplicates.find_near_duplicates
+        :return: list of DuplicateClusters
+        """
+        self._flush_attr_edits()
+        clusters = self._attributes.near_duplicates(threshold=threshold, **kwargs)
+        for cluster in clusters:
+            cluster.keys.sort(key=lambda k: -self._attr_references(k))
+        return clusters
+
+    def remap_duplicate_attribute_references(self, merges=None):
+        """
+        Point mappings to duplicate attributes at the originals instead.  The attribute set's exact duplicates
+        (self._attributes.dups) are always remapped; accepted near-duplicates may be added as merges.  A record
+        mapped to more than one member of a cluster keeps a single mapping to the original.
+        :param merges: iterable of DuplicateClusters (from near_duplicate_attributes) or (dup, orig) pairs
+        :return:
+        """
+        self._flush_attr_edits()
+        pairs = list(self._attributes.dups)
+        for merge in merges or []:
+            if isinstance(merge, DuplicateCluster):
+                pairs.extend(merge.merges())
+            else:
+                pairs.append(tuple(merge))
+
+        # one code map for all merges, following chains (a -> b, b -> c) to their end
+        target = dict()
+        for dup, orig in pairs:
+            dup = self._attr_codes.code(dup)
+            if dup == UNPARSED:
+                continue  # never referenced
+            target[dup] = self._attr_codes.intern(orig)
+        for dup in target.keys():
+            orig = target[dup]
+            seen = {dup}
+            while orig in target and orig not in seen:
+                seen.add(orig)
+                orig = target[orig]
+            target[dup] = orig
+        target = dict((dup, orig) for dup, orig in target.items() if dup != orig)
+        if len(target) == 0:
+            return
+
+        code_map = np.arange(len(self._attr_codes), dtype=code_dtype)
+        for dup, orig in target.items():
+            code_map[dup] = orig
+        for record, (name, key) in self._attr_tables.items():
+            mapping = getattr(self, name)
+            mapping['AttributeID'] = code_map[mapping['AttributeID'].values]
+            # a record mapped to both a duplicate and its original now has the original twice
+            mapping = mapping.drop_duplicates([key, 'AttributeID'])
+            setattr(self, name, mapping)
+            self._attr_index[record].rebuild(mapping)
+        self._bump_version()
+
+    _attr_tables = {
+        'question': ('_question_attributes', 'QuestionID'),
+        'target': ('_target_attributes', 'TargetID')
+    }
+
+    @contextmanager
+    def batch_edits(self):
+        """
+        Context for bulk attribute mapping edits:
+
+            with E.batch_edits():
+                for qid, attr in pairs:
+                    E.add_attribute_mapping(qid, attr)
+
+        Inside the context, add_attribute_mapping and del_attribute_mapping (and so set_title and set_category)
+        check for duplicates against the attribute index and buffer the change; the mapping DataFrames are
+        rewritten once, on exit.  Lookups through the attribute index (attributes_for, questions_with_attribute,
+        etc.) see buffered edits immediately.  Contexts may be nested; the outermost one commits.
+        :return:
+        """
+        if self._batch_depth == 0:
+            self._attr_edits = dict((record, (OrderedDict(), set())) for record in self._attr_tables)
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_attr_edits()
+                self._attr_edits = None
+
+    def _flush_attr_edits(self):
+        """
+        Write buffered attribute mapping edits into the mapping tables: one filter for all deletions and one
+        concatenation for all additions, per table.
+        :return:
+        """
+        if self._attr_edits is None:
+            return
+        for record, (adds, drops) in self._attr_edits.items():
+            name, key = self._attr_tables[record]
+            mapping = getattr(self, name)
+            if len(drops) > 0:
+                pair = mapping[key].values.astype(np.int64) << 32 | mapping['AttributeID'].values
+                drop = np.array([r << 32 | a for r, a in drops], dtype=np.int64)
+                mapping = mapping[~np.in1d(pair, drop)]
+            if len(adds) > 0:
+                start = self._next_label[name]
+                self._next_label[name] = start + len(adds)
+                rows = DataFrame({'AttributeID': np.array([a for r, a in adds], dtype=code_dtype),
+                                  key: np.array([r for r, a in adds], dtype=id_dtype)}, columns=mapping.columns,
+                                 index=np.arange(start, start + len(adds)))
+                mapping = concat([mapping, rows], verify_integrity=True)
+            setattr(self, name, mapping)
+            adds.clear()
+            drops.clear()
 
     def attributes_for(self, r_index, record='question'):
         return self._make_attr_list(r_index, record=record)
@@ -378,58 +599,55 @@ class MsspDataStore(object):
     def find_or_create_attribute(self, string):
         if string is None:
             return None
+        self._bump_version()
         return self._attributes.add_element(string)
 
     def update_attribute(self, attr, new_string):
         self._attributes.update_text(attr, new_string)
+        self._bump_version()
 
     def add_attribute_mapping(self, r_index, attr, record='question'):
         if attr is None:
             return
         if attr not in self._attributes.keys():
             raise KeyError('Attribute not found.')
+        code = self._attr_codes.intern(attr)
         if record == 'question':
-            qi = self._find_attr_map(self._question_attributes, r_index, attr)
-            if sum(qi) != 0:
-                print('attribute map - %d found' % sum(qi))
+            found = self._attr_index[record].count(r_index, code)
+            if found != 0:
+                print('attribute map - %d found' % found)
                 raise MsspError('QID %d: Attribute mapping already exists (%s)' % (r_index, self._attributes[attr]))
-            self._question_attributes = self._question_attributes.append(
-                {
-                    'AttributeID': attr,
-                    'QuestionID': r_index
-                },
-                ignore_index=True, verify_integrity=True)
         elif record == 'target':
-            qi = self._find_attr_map(self._target_attributes, r_index, attr)
-            if sum(qi) != 0:
-                print('attribute map - %d found' % sum(qi))
+            found = self._attr_index[record].count(r_index, code)
+            if found != 0:
+                print('attribute map - %d found' % found)
                 raise MsspError('TID %d: Attribute mapping already exists (%s)' % (r_index, self._attributes[attr]))
-            self._target_attributes = self._target_attributes.append(
-                {
-                    'AttributeID': attr,
-                    'TargetID': r_index
-                },
-                ignore_index=True, verify_integrity=True)
         else:
             raise ValueError('Unknown record specifier %s' % record)
+        with self.batch_edits():
+            adds, drops = self._attr_edits[record]
+            adds[(r_index, code)] = True
+        self._attr_index[record].add(r_index, code)
+        self._bump_version()
 
     def del_attribute_mapping(self, r_index, attr, record='question'):
-        if record == 'question':
-            mapping = self._question_attributes
-        elif record == 'target':
-            mapping = self._target_attributes
-        else:
+        if record not in self._attr_tables:
             raise ValueError('Unknown record specifier %s' % record)
 
-        qi = self._find_attr_map(mapping, r_index, attr)
-        if sum(qi) == 1:
-            if record == 'question':
-                self._question_attributes = mapping[~qi]
-            elif record == 'target':
-                self._target_attributes = mapping[~qi]
-            print('Removed %d reference' % sum(qi))
+        code = self._attr_codes.code(attr)
+        found = self._attr_index[record].count(r_index, code)
+        if found == 1:
+            with self.batch_edits():
+                adds, drops = self._attr_edits[record]
+                if (r_index, code) in adds:
+                    del adds[(r_index, code)]  # added earlier in this batch
+                else:
+                    drops.add((r_index, code))
+            self._attr_index[record].remove(r_index, code)
+            self._bump_version()
+            print('Removed %d reference' % found)
         else:
-            print('%d records found (0= no association; >1= something screwy' % sum(qi))
+            print('%d records found (0= no association; >1= something screwy' % found)
 
     def set_title(self, r_index, attr, record='question'):
         try:
@@ -440,6 +658,7 @@ class MsspDataStore(object):
             self._questions[r_index].title = attr
         elif record == 'target':
             self._targets[r_index].title = attr
+        self._bump_version()
 
     def set_category(self, r_index, attr, record='question'):
         try:
@@ -450,6 +669,7 @@ class MsspDataStore(object):
             self._questions[r_index].category = attr
         elif record == 'target':
             self._targets[r_index].category = attr
+        self._bump_version()
 
     def _reorder_answer_columns(self, question, table):
         """
@@ -517,7 +737,7 @@ class MsspDataStore(object):
         :param target:
         :return:
         """
-        return self._criteria.loc[self._criteria['TargetID'] == target]
+        return self._criteria.iloc[self._cri_index.rows('TargetID', target)]
 
     def caveats_for_target(self, target):
         """
@@ -525,7 +745,44 @@ class MsspDataStore(object):
         :param target:
         :return:
         """
-        return self._caveats.loc[self._caveats['TargetID'] == target]
+        return self._caveats.iloc[self._cav_index.rows('TargetID', target)]
+
+    @staticmethod
+    def _questions_for_targets(table, index, targets):
+        rows = [index.rows('TargetID', t) for t in targets]
+        if len(rows) == 0:
+            return []
+        return np.unique(table['QuestionID'].values[np.concatenate(rows)]).tolist()
+
+    def catalog(self, sel):
+        """
+        The targets of a given type, with the criteria and caveat questions that apply to them.  Computed once per
+        selector and kept until the next content edit.
+        :param sel: a valid selector
+        :return: a selectorCatalog of sorted ID lists: targets, criteria, caveats
+        """
+        cached = self._catalogs.get(sel)
+        if cached is not None and cached[0] == self._version:
+            self.catalog_hits += 1
+            return cached[1]
+        self.catalog_misses += 1
+        targets = [k for k, t in enumerate(self._targets) if t is not None and t.type == sel]
+        cat = selectorCatalog(targets,
+                              self._questions_for_targets(self._criteria, self._cri_index, targets),
+                              self._questions_for_targets(self._caveats, self._cav_index, targets))
+        self._catalogs[sel] = (self._version, cat)
+        return cat
+
+    def catalog_stats(self):
+        """
+        Selector catalog cache counters
+        :return: dict with keys 'version', 'hits', 'misses'
+        """
+        return {
+            'version': self._version,
+            'hits': self.catalog_hits,
+            'misses': self.catalog_misses
+        }
 
     def targets_for(self, sel):
         """
@@ -533,7 +790,7 @@ class MsspDataStore(object):
         :param sel:
         :return:
         """
-        return [k for k, t in enumerate(self._targets) if t is not None and t.type == sel]
+        return list(self.catalog(sel).targets)
 
     def criteria_for(self, sel):
         """
@@ -542,9 +799,7 @@ class MsspDataStore(object):
         :return:
         """
         if check_sel(sel):
-            t_targets = self.targets_for(sel)
-            return sorted(self._criteria.loc[self._criteria['TargetID'].isin(t_targets),
-                                             'QuestionID'].unique().tolist())
+            return list(self.catalog(sel).criteria)
 
         else:
             print('Selector must be one of %s' % list(selectors))
@@ -556,30 +811,169 @@ class MsspDataStore(object):
         :return:
         """
         if check_sel(sel):
-            t_targets = self.targets_for(sel)
-            return sorted(self._caveats.loc[self._caveats['TargetID'].isin(t_targets), 'QuestionID'].unique().tolist())
+            return list(self.catalog(sel).caveats)
 
         else:
             print('Selector must be one of %s' % list(selectors))
 
     def _remap_answers(self, question, mapping):
         """
-        Create new criteria and caveat tables where the answer values for a specific question are re-mapped
-        according to mapping.
+        Re-map the answer values for a specific question in the criteria and caveat tables according to mapping.
+        Only the question's rows are touched; only values change, so the row indexes remain valid.
         :param question: question ID
         :param mapping: a list of ints where mapping[old_index] = new_index
-        :return: critera, caveats -- edited copies of the original arrays
+        :return: nothing
         """
         print('Remapping answers with mapping %s' % mapping)
         print('map from: %s' % self._questions[question].valid_answers)
 
-        local_cri = self._criteria.copy()
-        local_cav = self._caveats.copy()
-        local_cri.loc[local_cri['QuestionID'] == question, 'Threshold'] = \
-            local_cri[local_cri['QuestionID'] == question]['Threshold'].map(lambda x: mapping[x])
-        local_cav.loc[local_cav['QuestionID'] == question, 'Answer'] = \
-            local_cav[local_cav['QuestionID'] == question]['Answer'].map(lambda x: mapping[x])
-        return local_cri, local_cav
+        mapping = np.array(mapping)
+        for name, index, column in (('_criteria', self._cri_index, 'Threshold'),
+                                    ('_caveats', self._cav_index, 'Answer')):
+            values = getattr(self, name)[column].values
+            rows = index.rows('QuestionID', question)
+            rows = rows[values[rows] != UNPARSED]
+            self._set_rows(name, column, rows, mapping[values[rows]])
+
+    # edit transactions
+    @contextmanager
+    def transaction(self, label=None):
+        """
+        Group edits so that they commit, roll back, and undo together:
+
+            with E.transaction('tidy question 53'):
+                E.merge_answers(53, ['low-medium', 'medium'])
+                E.reorder_answers(53, [2, 1, 0])
+
+        If the block raises, its edits are rolled back.  Transactions nest by joining the outermost one, and a
+        rollback at any level abandons all of it.  Each answer or question edit made outside a transaction is its
+        own transaction, so a failed edit never leaves the tables half-changed.
+        :param label: description shown by undo_history()
+        :return:
+        """
+        self.begin(label)
+        done = False
+        try:
+            yield self
+            done = True
+        finally:
+            if not done and self._undo.active:
+                self.rollback()
+        if self._undo.active:
+            self.commit()
+
+    def begin(self, label=None):
+        """
+        Open a transaction (or join the one already open)
+        """
+        self._undo.begin(label)
+
+    def commit(self):
+        """
+        Close the transaction opened by the matching begin()
+        """
+        self._undo.commit()
+
+    def rollback(self):
+        """
+        Revert every edit since the outermost open begin() and close the transaction
+        """
+        self._revert(self._undo.rollback())
+
+    def undo(self):
+        """
+        Revert the most recently committed transaction (or single edit)
+        :return: its label
+        """
+        label, ops = self._undo.peek()
+        self._revert(ops)
+        self._undo.pop()
+        return label
+
+    def undo_history(self):
+        """
+        Labels of the transactions that can be undone, oldest first
+        """
+        return self._undo.labels()
+
+    def _log(self, op):
+        if self._undo.active:
+            self._undo.log(op)
+
+    def _set_rows(self, name, column, rows, values):
+        """
+        Set a table column at the given row positions in place, logging the old values by row label
+        :param name: table attribute name ('_criteria', '_caveats', '_question_attributes')
+        :param column:
+        :param rows: row positions
+        :param values: new values (array or scalar)
+        """
+        if len(rows) == 0:
+            return
+        table = getattr(self, name)
+        j = table.columns.get_loc(column)
+        self._log(('values', name, column, table.index.values[rows], table[column].values[rows].copy()))
+        table.iloc[rows, j] = values
+
+    def _drop_rows(self, name, rows):
+        """
+        Remove the rows at the given positions from a table, logging them (with their labels)
+        """
+        if len(rows) == 0:
+            return
+        table = getattr(self, name)
+        self._log(('rows', name, table.iloc[rows]))
+        keep = np.ones(len(table), dtype=bool)
+        keep[rows] = False
+        setattr(self, name, table[keep])
+
+    def _log_question(self, question):
+        """
+        Log the current state of a question record before changing or removing it
+        """
+        obj = self._questions[question]
+        if obj is None:
+            self._log(('question', question, None, None))
+        else:
+            self._log(('question', question, obj, dict((k, copy(v)) for k, v in obj.__dict__.items())))
+
+    def _revert(self, ops):
+        """
+        Apply inverse operations (latest first), then rebuild the indexes over the affected tables.  Rows are found
+        by label, so mapping edits made since (which are not logged) do not misdirect the inverse operations; rows
+        those edits removed are skipped.
+        """
+        self._flush_attr_edits()
+        for op in ops:
+            kind = op[0]
+            if kind == 'values':
+                name, column, labels, values = op[1:]
+                table = getattr(self, name)
+                rows = table.index.get_indexer(labels)
+                found = rows >= 0
+                table.iloc[rows[found], table.columns.get_loc(column)] = values[found]
+            elif kind == 'rows':
+                name, removed = op[1:]
+                table = getattr(self, name)
+                # labels increase down each table, so sorting on them puts the rows back where they were
+                setattr(self, name, concat([table, removed]).sort_index(kind='mergesort'))
+            elif kind == 'answers':
+                question, answers = op[1:]
+                self._questions[question].valid_answers = answers
+            elif kind == 'insert_answer':
+                question, ind, answer = op[1:]
+                self._questions[question].valid_answers.insert(ind, answer)
+            elif kind == 'question':
+                question, obj, state = op[1:]
+                if obj is not None:
+                    obj.__dict__.update(state)
+                self._questions[question] = obj
+            else:
+                raise MsspError('Unknown inverse operation %s' % kind)
+        self._cri_index.rebuild(self._criteria)
+        self._cav_index.rebuild(self._caveats)
+        self._attr_index['question'].rebuild(self._question_attributes)
+        self._invalidate_compiled()
 
     def refactor_answers(self, question, answers):
         """
@@ -591,8 +985,8 @@ class MsspDataStore(object):
         The method will generate a mapping from the current answers to the new answers, and then will go through
         all the criteria and caveats, re-mapping the index values.
 
-        This method is made atomic by performing the mapping onto new data frames that are only installed if
-        the operation is successful.
+        The edit is made in place on the question's rows only, and is atomic: if it fails part-way, it is rolled
+        back.  It can be reverted afterwards with undo().
         :param question:
         :param answers:
         :return:
@@ -622,10 +1016,11 @@ class MsspDataStore(object):
             # mapping[old_index] = new_index
             mapping[i] = tmp[cur[i]]
 
-        new_cri, new_cav = self._remap_answers(question, mapping)
-        self._criteria = new_cri
-        self._caveats = new_cav
-        self._questions[question].valid_answers = answers
+        with self.transaction('refactor_answers(%s)' % question):
+            self._remap_answers(question, mapping)
+            self._log(('answers', question, cur))
+            self._questions[question].valid_answers = answers
+            self._invalidate_compiled()
 
     def reorder_answers(self, question, answer_indices):
         """
@@ -661,18 +1056,20 @@ class MsspDataStore(object):
         assert len(ind) == 1, "Not enough / too many answers found"
         ind = ind[0]
 
-        cri_index = (self._criteria['QuestionID'] == question) & (self._criteria['Threshold'] == ind)
-        cav_index = (self._caveats['QuestionID'] == question) & (self._caveats['Answer'] == ind)
+        rows = self._cri_index.rows('QuestionID', question)
+        cri_drop = rows[self._criteria['Threshold'].values[rows] == ind]
+        rows = self._cav_index.rows('QuestionID', question)
+        cav_drop = rows[self._caveats['Answer'].values[rows] == ind]
 
         check = False
-        if len(cri_index.loc[cri_index]) > 0:
+        if len(cri_drop) > 0:
             print('Matching Criteria:')
-            print(self._criteria.loc[cri_index])
+            print(self._criteria.iloc[cri_drop])
             check = True
 
-        if len(cav_index.loc[cav_index]) > 0:
+        if len(cav_drop) > 0:
             print('Matching Caveats:')
-            print(self._caveats.loc[cav_index])
+            print(self._caveats.iloc[cav_drop])
             check = True
 
         if check:
@@ -683,15 +1080,15 @@ class MsspDataStore(object):
         a = range(len(cur))
         mapping = a[:ind] + [-1] + a[ind:-1]  # -1 gets deleted below
 
-        new_cri, new_cav = self._remap_answers(question, mapping)
-
-        new_cri = new_cri.loc[~cri_index]
-        new_cav = new_cav[~cav_index]
-
-        # 'atomic' update
-        del cur[ind]  # aha! delete by reference!
-        self._criteria = new_cri
-        self._caveats = new_cav
+        with self.transaction('delete_answer(%s, %s)' % (question, answer)):
+            self._remap_answers(question, mapping)
+            self._drop_rows('_criteria', cri_drop)
+            self._drop_rows('_caveats', cav_drop)
+            self._cri_index.drop(cri_drop)
+            self._cav_index.drop(cav_drop)
+            self._log(('insert_answer', question, ind, cur[ind]))
+            del cur[ind]  # aha! delete by reference!
+            self._invalidate_compiled()
 
     def merge_answers(self, question, answers, merge_to=None):
         """
@@ -741,12 +1138,12 @@ class MsspDataStore(object):
             print('NOT merged.')
             return
 
-        new_cri, new_cav = self._remap_answers(question, mapping)
-        self._criteria = new_cri
-        self._caveats = new_cav
-        for i in ans_ind:
-            if i != merge_ind:
-                self.delete_answer(question, cur[i])
+        with self.transaction('merge_answers(%s)' % question):
+            self._remap_answers(question, mapping)
+            self._invalidate_compiled()
+            # deleting shifts later answers down, so find each one by value
+            for ans in [cur[i] for i in ans_ind if i != merge_ind]:
+                self.delete_answer(question, ans)
 
     def _remap_questions(self, questions, map_to=None):
         """
@@ -759,8 +1156,14 @@ class MsspDataStore(object):
         if map_to is None:
             map_to = min(questions)
 
-        for table in self._question_attributes, self._caveats, self._criteria:
-            table.loc[table['QuestionID'].isin(questions), 'QuestionID'] = map_to
+        self._flush_attr_edits()
+        for name in '_question_attributes', '_caveats', '_criteria':
+            column = getattr(self, name)['QuestionID'].values
+            self._set_rows(name, 'QuestionID', np.flatnonzero(np.in1d(column, questions)), map_to)
+        self._attr_index['question'].rebuild(self._question_attributes)  # keeps attributes in table order
+        self._cri_index.relabel('QuestionID', questions, map_to)
+        self._cav_index.relabel('QuestionID', questions, map_to)
+        self._invalidate_compiled()
 
     def _merge_and_delete(self, q, merge_to=None):
         """
@@ -773,15 +1176,19 @@ class MsspDataStore(object):
             return
         if merge_to == q:
             return
+        self._log_question(merge_to)
+        self._log_question(q)
         self._questions[merge_to].merge(self._questions[q])
         self._questions[q] = None
+        self._invalidate_compiled()
 
     def merge_questions(self, questions):
         """
         Joins all the questions' valid answers together, then refactors all questions to
         have the same valid_answer list. Last thing is to re-map all the QuestionIDs from the merged questions
         onto the one with the lowest ID in: _criteria, _caveats, _question_attributes
-        then the merged questions can be replaced with Nones.
+        then the merged questions can be replaced with Nones.  Other questions' satisfied_by references to the merged
+        questions are re-pointed at the surviving one.
         :param questions:
         :return:
         """
@@ -791,28 +1198,66 @@ class MsspDataStore(object):
                 if v not in new_answers:
                     new_answers.append(v)
 
-        for q in questions:
-            self.refactor_answers(q, new_answers)  # now all questions have the same answers properly mapped
-
         merge_to = min(questions)
 
-        self._remap_questions(questions, map_to=merge_to)
+        with self.transaction('merge_questions(%s)' % ', '.join(str(q) for q in questions)):
+            for q in questions:
+                self.refactor_answers(q, new_answers)  # now all questions have the same answers properly mapped
 
-        for q in questions:
-            if q != merge_to:
-                self._merge_and_delete(q, merge_to=merge_to)
+            self._remap_questions(questions, map_to=merge_to)
 
-    @staticmethod
-    def _search_mapping(attrs, mapping):
+            for q in questions:
+                if q != merge_to:
+                    self._merge_and_delete(q, merge_to=merge_to)
+
+            self._remap_satisfied_by(set(questions) - {merge_to}, merge_to)
+
+    def _remap_satisfied_by(self, merged, merge_to):
+        """
+        Point satisfied_by and satisfies references to merged questions at the question they were merged into.  A
+        question cannot satisfy itself, so references among the merged questions are dropped.
+        :param merged: set of QuestionIDs that have been merged away
+        :param merge_to: the surviving QuestionID
+        :return:
+        """
+        changed = False
+        for k, obj in enumerate(self._questions):
+            if obj is None:
+                continue
+            satisfied_by = set(merge_to if i in merged else i for i in obj.satisfied_by) - {k}
+            satisfies = set(merge_to if i in merged else i for i in obj.satisfies) - {k}
+            if satisfied_by != obj.satisfied_by or satisfies != obj.satisfies:
+                self._log_question(k)
+                obj.satisfied_by = satisfied_by
+                obj.satisfies = satisfies
+                changed = True
+        if changed:
+            self._invalidate_compiled()
+
+    def _search_mapping(self, attrs, record):
         """
         Atomic search- returns records containing an attribute that matches the search term.
-        :param attrs: list of attribute IDs
-        :param mapping: either a
+        :param attrs: array of attribute codes
+        :param record: 'question' or 'target'
         :return: a set of indices into the specified record list
         """
-        return set(mapping[mapping['AttributeID'].isin(attrs)][mapping.columns[1]])
+        index = self._attr_index[record]
+        found = set()
+        for attr in attrs.tolist():
+            found.update(index.records(attr))
+        return found
 
-    def search(self, terms, search_notes=False, match_any=False):
+    def index_text(self):
+        """
+        Build token indexes over attribute and note text.  search() then only regex-tests the elements that can
+        contain a plain search term, and search(..., as_you_type=True) is served from the index alone.  The
+        indexes are maintained as elements are added or edited.
+        :return:
+        """
+        self._attributes.build_index()
+        self._notes.build_index()
+
+    def search(self, terms, search_notes=False, match_any=False, as_you_type=False):
         """
         Find records that contain attributes [or notes] matching the search terms.  'terms' should be a single
         string or a list of strings.  If a list is provided, the search will return entries that match all terms
@@ -821,16 +1266,22 @@ class MsspDataStore(object):
 
         By default, searches on attributes.  Search notes instead by specifying search_notes=True.
 
+        By default, terms are case-insensitive regexes matched anywhere in the text.  With as_you_type=True, terms
+        are matched word by word instead: every word must appear, the last one possibly incomplete, and
+        double-quoted parts must appear as phrases (see SemanticElementSet.search_tokens).
+
         By default, returns a namedtuple with names 'attributes' [or 'notes'], 'questions', and 'targets', with each
         field containing a list of indices into self.{attributes|notes|questions|targets}
 
         :param terms: string or list of strings to search on
         :param search_notes: (bool) search on notes (i.e. "caveats") instead of attributes (default False)
         :param match_any: (bool) match any search term (default False is to match all search terms)
+        :param as_you_type: (bool) match words and word prefixes from the text index (default False)
         :return:
         """
         if isinstance(terms, basestring):
             terms = [terms]
+        self._flush_attr_edits()  # the mapping tables are read directly below
         if match_any:
             q_results = set()
             t_results = set()
@@ -845,25 +1296,30 @@ class MsspDataStore(object):
                 a_results = set(self._attributes.keys())
             operation = set.intersection
 
+        elements = self._notes if search_notes else self._attributes
+        if as_you_type:
+            matches = [elements.search_tokens(term) for term in terms]
+        else:
+            matches = elements.search_terms(terms)  # one pass over the text for all terms
+
         if search_notes:
             rt = searchNotes
-            for term in terms:
-                notes = self._notes.search(term)
+            for notes in matches:
                 a_results = operation(a_results, notes)
 
-                n_results = self._caveats[self._caveats['NoteID'].isin(notes)]
+                n_results = self._caveats[self._caveats['NoteID'].isin(self._note_codes.lookup(notes))]
 
-                q_results = operation(q_results, set(n_results['QuestionID']))
-                t_results = operation(t_results, set(n_results['TargetID']))
+                q_results = operation(q_results, set(n_results['QuestionID'].tolist()))
+                t_results = operation(t_results, set(n_results['TargetID'].tolist()))
 
         else:
             rt = searchAttributes
-            for term in terms:
-                attrs = self._attributes.search(term)
+            for attrs in matches:
                 a_results = operation(a_results, attrs)
 
-                q_results = operation(q_results, self._search_mapping(attrs, self._question_attributes))
-                t_results = operation(t_results, self._search_mapping(attrs, self._target_attributes))
+                codes = self._attr_codes.lookup(attrs)
+                q_results = operation(q_results, self._search_mapping(codes, 'question'))
+                t_results = operation(t_results, self._search_mapping(codes, 'target'))
 
         return rt(*(sorted(list(k)) for k in (a_results, q_results, t_results)))
 
@@ -946,23 +1402,43 @@ class MsspDataStore(object):
             targets.append(add)
 
         print "Creating {0} criteria...".format(len(self._criteria))
-        for i, k in self._criteria.iterrows():
-            threshold = self._questions[k['QuestionID']].valid_answers[k['Threshold']]
+        views = self.decoded_views()
+        cri_q = self._criteria['QuestionID'].values
+        thresholds = views.answers(cri_q, self._criteria['Threshold'].values)
+        for qid, threshold, tid in zip(cri_q.tolist(), thresholds, self._criteria['TargetID'].values.tolist()):
             add = {
-                "QuestionID": long(k['QuestionID']),
+                "QuestionID": long(qid),
                 "Threshold": threshold,
-                "TargetID": long(k['TargetID'])
+                "TargetID": long(tid)
             }
             criteria.append(add)
 
-        cav_groups = self._caveats.groupby(['QuestionID', 'TargetID'])
-
-        print "Creating {0} caveats...".format(len(cav_groups))
-        for (qid, tid), group in cav_groups:
-            answers = [{"Answer": a} for i, a in enumerate(self._questions[qid].valid_answers)]
-            for i, r in group.iterrows():
-                answers[r['Answer']]['NoteID'] = str(r['NoteID'])
-                note_set.add(r['NoteID'])
+        # one pass over the caveats, grouped by (QuestionID, TargetID) with rows in table order within groups
+        cav_q = self._caveats['QuestionID'].values
+        cav_t = self._caveats['TargetID'].values
+        cav_a = self._caveats['Answer'].values.tolist()
+        cav_n = self._caveats['NoteID'].values
+        order = np.lexsort((cav_t, cav_q))
+        bounds = np.flatnonzero((np.diff(cav_q[order]) != 0) | (np.diff(cav_t[order]) != 0)) + 1
+        starts = np.concatenate(([0], bounds)).tolist() if len(order) > 0 else []
+        ends = starts[1:] + [len(order)]
+
+        valid = self._caveats['Answer'].values != UNPARSED
+        note_codes = np.unique(cav_n[valid])
+        note_str = dict((c, str(u)) for c, u in zip(note_codes.tolist(), self._note_codes.decode(note_codes)))
+        note_set.update(self._note_codes.decode(note_codes))
+        cav_n = cav_n.tolist()
+        order = order.tolist()
+
+        print "Creating {0} caveats...".format(len(starts))
+        for start, end in zip(starts, ends):
+            qid = int(cav_q[order[start]])
+            tid = int(cav_t[order[start]])
+            answers = [{"Answer": a} for a in self._questions[qid].valid_answers]
+            for r in order[start:end]:
+                if cav_a[r] == UNPARSED:
+                    continue
+                answers[cav_a[r]]['NoteID'] = note_str[cav_n[r]]
             add = {
                 "QuestionID": qid,
                 "TargetID": tid,
@@ -979,18 +1455,19 @@ class MsspDataStore(object):
 
         print "Creating {0} notes...".format(len(note_set))
         for note in note_set:
+            element = self._notes[note]
             notes.append({
                 "NoteID": str(note),
-                "NoteText": self._notes[note].text,
-                "NoteColor": self._color_of_cell(self._notes[note])
+                "NoteText": element.text,
+                "NoteColor": self._color_of_cell(element)
             })
 
         print "Creating colormap..."
-        for i, k in self.colormap.iterrows():
+        for rgb, name, score in zip(self._colormap.rgbs, self._colormap.names, self._colormap.scores):
             add = {
-                "RGB": k['RGB'],
-                "ColorName": k['ColorName'],
-                "Score": k['Score']
+                "RGB": rgb,
+                "ColorName": name,
+                "Score": score
             }
             colormap.append(add)
 
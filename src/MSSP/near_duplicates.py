@@ -0,0 +1,187 @@
+"""
+Near-duplicate detection for SemanticElementSets.
+
+Element sets only refuse exact duplicates.  Elements whose texts differ in punctuation, case or spacing get
+separate UUIDs, and the workshop process produces a steady supply of them.  To find them without comparing every
+pair of elements:
+
+ - each text is normalized (lower case, runs of punctuation and whitespace collapsed to one space) and cut into
+   overlapping character n-grams ("shingles");
+ - each shingle set gets a MinHash signature, whose entries agree between two sets with probability equal to
+   their Jaccard similarity;
+ - signatures are cut into bands, and elements sharing any band are put in the same bucket (locality-sensitive
+   hashing).  Only pairs that share a bucket are candidates;
+ - candidates are scored by the exact Jaccard similarity of their shingle sets, pairs above a threshold are kept,
+   and linked pairs are gathered into clusters.
+
+The defaults (64 hashes in 16 bands of 4) make pairs with similarity 0.8 candidates with probability near 1, and
+pairs with similarity 0.3 candidates rarely.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+
+normalize_re = re.compile(r'[\W_]+', flags=re.U)
+
+_prime = (1 << 31) - 1
+
+
+def normalize(text):
+    """
+    Lower-cased text with punctuation and whitespace runs collapsed to single spaces
+    """
+    if text is None:
+        return ''
+    return normalize_re.sub(' ', unicode(text).lower()).strip()
+
+
+def shingles(text, n=3):
+    """
+    Set of character n-grams of the normalized text (the whole text if it is shorter than n)
+    """
+    s = normalize(text)
+    if len(s) == 0:
+        return set()
+    if len(s) <= n:
+        return {s}
+    return set(s[i:i + n] for i in range(len(s) - n + 1))
+
+
+def jaccard(a, b):
+    if len(a) == 0 and len(b) == 0:
+        return 1.0
+    return len(a & b) / float(len(a | b))
+
+
+class MinHasher(object):
+    """
+    MinHash signatures from a fixed family of hash functions h(x) = (a * x + b) mod p, applied to the crc32 of each
+    shingle.
+    """
+    def __init__(self, num_perm=64, seed=0):
+        rand = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rand.randint(1, _prime, size=num_perm).astype(np.uint64)
+        self._b = rand.randint(0, _prime, size=num_perm).astype(np.uint64)
+
+    def signature(self, shingle_set):
+        """
+        :param shingle_set: non-empty set of unicode shingles
+        :return: uint64 array of length num_perm
+        """
+        x = np.array([zlib.crc32(s.encode('utf-8')) & 0x7fffffff for s in shingle_set], dtype=np.uint64)
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % _prime).min(axis=1)
+
+
+class DuplicateCluster(object):
+    """
+    A group of elements linked by near-duplicate pairs.
+
+    Attributes:
+        obj.keys = element keys, representative first
+        obj.pairs = list of (key, key, similarity) links found between members
+    """
+    def __init__(self, keys, pairs):
+        self.keys = list(keys)
+        self.pairs = list(pairs)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def representative(self):
+        return self.keys[0]
+
+    @property
+    def score(self):
+        """
+        Lowest similarity among the cluster's links
+        """
+        return min(s for a, b, s in self.pairs)
+
+    def merges(self):
+        """
+        (duplicate, original) pairs that fold the cluster into its representative, in the form of
+        SemanticElementSet.dups
+        """
+        return [(k, self.representative) for k in self.keys[1:]]
+
+    def __repr__(self):
+        return 'DuplicateCluster(%d keys, score %.3f)' % (len(self.keys), self.score)
+
+
+def _clusters(keys, pairs):
+    """
+    Connected components of the pair graph (union-find), each with its links
+    """
+    parent = dict((k, k) for k in keys)
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for a, b, s in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    members = defaultdict(list)
+    for k in keys:
+        members[find(k)].append(k)
+    links = defaultdict(list)
+    for pair in pairs:
+        links[find(pair[0])].append(pair)
+    return [DuplicateCluster(sorted(members[r]), sorted(links[r], key=lambda p: -p[2]))
+            for r in links]
+
+
+def find_near_duplicates(items, threshold=0.8, n=3, num_perm=64, bands=16, seed=0):
+    """
+    Cluster near-duplicate texts.
+    :param items: iterable of (key, text, group) triples; only texts in the same group are compared (pass the
+     same group for all to compare everything)
+    :param threshold: minimum Jaccard similarity of shingle sets for a pair to be linked
+    :param n: shingle length
+    :param num_perm: MinHash signature length
+    :param bands: number of LSH bands; must divide num_perm
+    :param seed: seed of the hash family
+    :return: list of DuplicateClusters, largest first
+    """
+    if num_perm % bands != 0:
+        raise ValueError('bands must divide num_perm')
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm=num_perm, seed=seed)
+
+    sets = dict()
+    buckets = defaultdict(list)
+    for key, text, group in items:
+        sh = shingles(text, n=n)
+        if len(sh) == 0:
+            continue
+        sets[key] = sh
+        sig = hasher.signature(sh)
+        for band in range(bands):
+            buckets[(group, band, sig[band * rows:(band + 1) * rows].tostring())].append(key)
+
+    candidates = set()
+    for bucket in buckets.values():
+        for i in range(len(bucket)):
+            for j in range(i + 1, len(bucket)):
+                candidates.add((bucket[i], bucket[j]) if bucket[i] < bucket[j] else (bucket[j], bucket[i]))
+
+    pairs = []
+    for a, b in candidates:
+        s = jaccard(sets[a], sets[b])
+        if s >= threshold:
+            pairs.append((a, b, s))
+
+    clusters = _clusters(sets.keys(), pairs)
+    return sorted(clusters, key=lambda c: (-len(c), -c.score, c.keys[0]))
@@ -0,0 +1,104 @@
+"""
+Persistent row-position indexes over the criteria and caveats tables.
+
+A RowIndex records, for each key column (QuestionID, TargetID), the positions of the rows holding each value.
+A lookup is then a dict access plus DataFrame.iloc on the matching rows, instead of a boolean mask over the whole
+table.  Positions are kept in ascending order so that iloc returns rows in table order, exactly as the masks did.
+
+The index describes row positions, not labels, so it must be told about every edit that adds, removes or re-keys
+rows.  Edits that only change non-key values (thresholds, answers) leave it valid.
+"""
+
+import numpy as np
+
+
+_no_rows = np.zeros(0, dtype=int)
+
+
+class RowIndex(object):
+    """
+    Row positions of a DataFrame grouped by the values of its key columns.
+
+    Internals:
+        obj._groups[key][value] = sorted int array of positions of rows where df[key] == value
+    """
+    def __init__(self, df, keys=('QuestionID', 'TargetID')):
+        """
+
+        :param df: a DataFrame
+        :param keys: key columns to index
+        :return:
+        """
+        self.keys = tuple(keys)
+        self._groups = dict()
+        self._length = 0
+        self.rebuild(df)
+
+    def rebuild(self, df):
+        """
+        Re-index from scratch
+        :param df:
+        :return:
+        """
+        self._length = len(df)
+        for key in self.keys:
+            values = np.asarray(df[key].values)
+            order = np.argsort(values, kind='mergesort')  # stable: positions stay ascending within a group
+            ordered = values[order]
+            starts = np.concatenate(([0], np.flatnonzero(ordered[1:] != ordered[:-1]) + 1))
+            ends = np.concatenate((starts[1:], [len(ordered)]))
+            self._groups[key] = dict((ordered[s].item(), order[s:e]) for s, e in zip(starts, ends) if e > s)
+
+    def __len__(self):
+        return self._length
+
+    def rows(self, key, value):
+        """
+        Positions of the rows with df[key] == value
+        :param key: key column
+        :param value:
+        :return: sorted int array (empty if none)
+        """
+        return self._groups[key].get(value, _no_rows)
+
+    def values(self, key):
+        """
+        Distinct values present in a key column
+        """
+        return sorted(self._groups[key].keys())
+
+    def relabel(self, key, values, new_value):
+        """
+        Record that every row whose key was in values now has key new_value
+        :param key: key column
+        :param values: old key values
+        :param new_value:
+        :return:
+        """
+        groups = self._groups[key]
+        merged = [groups.pop(v) for v in set(values) if v in groups]
+        if new_value in groups:
+            merged.append(groups[new_value])
+        if len(merged) > 0:
+            groups[new_value] = np.sort(np.concatenate(merged), kind='mergesort')
+
+    def drop(self, positions):
+        """
+        Record that the rows at the given positions have been removed from the table (and the remaining rows
+        closed up, as with df[mask])
+        :param positions: positions of the removed rows, relative to the table before removal
+        :return:
+        """
+        positions = np.unique(np.asarray(positions, dtype=int))
+        if len(positions) == 0:
+            return
+        self._length -= len(positions)
+        for key in self.keys:
+            groups = self._groups[key]
+            for value in list(groups.keys()):
+                rows = groups[value]
+                rows = rows[~np.in1d(rows, positions)]
+                if len(rows) == 0:
+                    del groups[value]
+                else:
+                    groups[value] = rows - np.searchsorted(positions, rows)
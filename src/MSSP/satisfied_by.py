@@ -0,0 +1,187 @@
+"""
+The 'SatisfiedBy' relation between questions, compiled into a DAG.
+
+A question with a non-empty satisfied_by set is never asked directly: its answer is derived as the maximum of
+the answers to its satisfiers (which may themselves be derived).  For that to make sense the relation must be
+acyclic and every satisfier must have the same valid_answers sequence as the question it satisfies.  The
+SatisfiedByGraph checks both when it is built and orders the derived questions so that every question comes
+after all of its satisfiers.  Derived answers then resolve in one pass in that order, and when a single answer
+changes only the questions downstream of it are recomputed.
+"""
+
+from __future__ import print_function
+
+from collections import defaultdict
+
+from MSSP.exceptions import MsspError
+
+
+class SatisfiedByGraph(object):
+    """
+    Topologically sorted satisfied_by relation over a question enum.
+
+    Internals:
+        obj._satisfied_by[q] = sorted list of QuestionIDs that satisfy derived question q
+        obj._satisfies[q] = set of derived QuestionIDs that q satisfies
+        obj.order = derived QuestionIDs, each after all of its satisfiers
+    """
+    def __init__(self, questions):
+        """
+
+        :param questions: the question enum of an MsspDataStore
+        :return:
+        """
+        self._satisfied_by = dict()
+        self._satisfies = defaultdict(set)
+        self._downstream = dict()  # memo for downstream()
+
+        errors = []
+        for k, q in enumerate(questions):
+            if q is None or len(q.satisfied_by) == 0:
+                continue
+            for i in q.satisfied_by:
+                if i >= len(questions) or questions[i] is None:
+                    errors.append('QuestionID %d is satisfied by missing question %d' % (k, i))
+                elif questions[i].valid_answers != q.valid_answers:
+                    errors.append('QuestionID %d is satisfied by question %d with different valid answers' % (k, i))
+                self._satisfies[i].add(k)
+            self._satisfied_by[k] = sorted(q.satisfied_by)
+        if len(errors) > 0:
+            raise MsspError('Invalid satisfied_by relation:\n  %s' % '\n  '.join(errors))
+
+        self.order = self._sort()
+        self._rank = dict((q, i) for i, q in enumerate(self.order))
+
+    def _sort(self):
+        """
+        Kahn's algorithm over the derived questions
+        :return: list of derived QuestionIDs in dependency order
+        """
+        pending = dict((q, len([i for i in sb if i in self._satisfied_by]))
+                       for q, sb in self._satisfied_by.items())
+        ready = sorted(q for q, n in pending.items() if n == 0)
+        order = []
+        while len(ready) > 0:
+            q = ready.pop(0)
+            order.append(q)
+            for s in sorted(self._satisfies[q]):
+                pending[s] -= 1
+                if pending[s] == 0:
+                    ready.append(s)
+        if len(order) < len(pending):
+            cycle = sorted(q for q, n in pending.items() if n > 0)
+            raise MsspError('satisfied_by relation has a cycle among questions %s' % cycle)
+        return order
+
+    def __len__(self):
+        return len(self.order)
+
+    def is_derived(self, question):
+        return question in self._satisfied_by
+
+    def satisfiers(self, question):
+        return self._satisfied_by.get(question, [])
+
+    def satisfies(self, question):
+        return sorted(self._satisfies.get(question, set()))
+
+    def base_questions(self, question):
+        """
+        The non-derived questions that (transitively) satisfy a question
+        :param question:
+        :return: sorted list of QuestionIDs; [question] itself if it is not derived
+        """
+        if not self.is_derived(question):
+            return [question]
+        base = set()
+        for i in self._satisfied_by[question]:
+            base.update(self.base_questions(i))
+        return sorted(base)
+
+    def lineage(self, question):
+        """
+        The derived questions that (transitively) satisfy a question, plus the question itself if derived
+        :param question:
+        :return: list of derived QuestionIDs in dependency order
+        """
+        found = set()
+        stack = [question]
+        while len(stack) > 0:
+            q = stack.pop()
+            if self.is_derived(q) and q not in found:
+                found.add(q)
+                stack.extend(self._satisfied_by[q])
+        return sorted(found, key=lambda x: self._rank[x])
+
+    def downstream(self, question):
+        """
+        The derived questions (transitively) satisfied by a question
+        :param question:
+        :return: list of derived QuestionIDs in dependency order
+        """
+        if question not in self._downstream:
+            found = set()
+            stack = list(self._satisfies.get(question, set()))
+            while len(stack) > 0:
+                q = stack.pop()
+                if q not in found:
+                    found.add(q)
+                    stack.extend(self._satisfies.get(q, set()))
+            self._downstream[question] = sorted(found, key=lambda x: self._rank[x])
+        return self._downstream[question]
+
+    def derive(self, question, answers):
+        """
+        Derived answer to a question given the current answers to its satisfiers
+        :param question: a derived QuestionID
+        :param answers: dict of QuestionID: answer index
+        :return: answer index, or None if none of the satisfiers is answered
+        """
+        given = [answers[i] for i in self._satisfied_by[question] if i in answers]
+        if len(given) == 0:
+            return None
+        return max(given)
+
+    @staticmethod
+    def _store(answers, question, value):
+        if value is None:
+            answers.pop(question, None)
+        else:
+            answers[question] = value
+
+    def resolve(self, answers, questions=None):
+        """
+        Compute derived answers in one pass in dependency order.  The answers dict is updated in place.
+        :param answers: dict of QuestionID: answer index
+        :param questions: derived questions to resolve, in dependency order (default: all)
+        :return: list of (QuestionID, new answer or None) for derived answers that changed
+        """
+        if questions is None:
+            questions = self.order
+        changed = []
+        for q in questions:
+            value = self.derive(q, answers)
+            if value != answers.get(q):
+                self._store(answers, q, value)
+                changed.append((q, value))
+        return changed
+
+    def propagate(self, answers, question):
+        """
+        Re-derive only the answers downstream of a question whose answer has just changed.  A derived question is
+        recomputed only if one of its satisfiers changed.  The answers dict is updated in place.
+        :param answers: dict of QuestionID: answer index, already holding the question's new answer
+        :param question: the changed QuestionID
+        :return: list of (QuestionID, new answer or None) for derived answers that changed
+        """
+        dirty = set([question])
+        changed = []
+        for q in self.downstream(question):
+            if not dirty.intersection(self._satisfied_by[q]):
+                continue
+            value = self.derive(q, answers)
+            if value != answers.get(q):
+                self._store(answers, q, value)
+                changed.append((q, value))
+                dirty.add(q)
+        return changed
@@ -0,0 +1,660 @@
+"""
+Vectorized scoring of answer profiles against MSSP targets.
+
+The FisheryGuide qualifies and scores targets one at a time by walking the criteria and caveats tables row by
+row.  A ScoringEngine compiles those tables once into dense arrays indexed by QuestionID and TargetID:
+
+ * thresholds[q, t] -- the minimum answer index to question q that passes target t's criterion
+ * linked[q, t] -- whether target t has a criterion on question q at all
+ * passing[q, a, t] -- whether target t's criterion on question q is met by answer index a (the qualification
+   index: one target bool vector per question and answer)
+ * caveat_scores[q, a, t] -- the summed note score target t receives when question q is answered with index a
+ * scope[q, t] -- whether the answer to question q can disqualify target t under its selector's filter rule
+
+Note scores come from the 'Score' column of the engine's colormap: each note's fill color is encoded once as an
+integer color code, and the per-caveat scores are a gather from the colormap's score array.
+
+An answer profile is encoded as a vector of answer indices over QuestionIDs (UNANSWERED where missing).  Any
+number of profiles can then be qualified and scored against every target with a handful of numpy operations,
+and only the targets that are actually reported need their profile dicts built.
+
+A CriteriaScheduler orders the unanswered criteria questions of a selector by how many remaining candidate
+targets their answer could still eliminate, then asks the ones every answer passes (left unanswered, they still
+fail), and stops once no remaining question bears on a candidate.
+
+An IncrementalScorer keeps per-target criteria failure counts and caveat score totals for a single answer
+profile, so that changing one answer only touches the targets linked to that question.
+
+The ScoringEngine is a snapshot: it must be rebuilt when the criteria, caveats, questions, or colormap of the
+underlying MsspDataStore change.  MsspDataStore.scoring_engine() takes care of that.
+"""
+
+from __future__ import print_function
+
+from collections import defaultdict, namedtuple
+import heapq
+
+import numpy as np
+
+from MSSP.utils import check_sel, selectors
+from MSSP.exceptions import MsspError, BadSelectorError
+from MSSP.interning import UNPARSED
+
+
+UNANSWERED = -1
+
+
+def _native(value):
+    """
+    numpy scalar to python scalar, for json output
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+answerDelta = namedtuple('answerDelta', ['questions', 'entered', 'left', 'scores'])
+answerSensitivity = namedtuple('answerSensitivity', ['questions', 'targets', 'valid', 'qualifying', 'scores'])
+
+
+class ScoringEngine(object):
+    """
+    Dense array representation of an MsspDataStore's criteria and caveats, for batch evaluation of answer profiles.
+    """
+    def __init__(self, mssp_engine):
+        """
+
+        :param mssp_engine: an MsspDataStore
+        :return:
+        """
+        self._engine = mssp_engine
+        self._valid_answers = [None if q is None else list(q.valid_answers) for q in mssp_engine._questions]
+        self.n_questions = len(self._valid_answers)
+        self.n_targets = len(mssp_engine._targets)
+        self.n_answers = max([len(v) for v in self._valid_answers if v is not None] + [1])
+        self.n_valid = np.array([0 if v is None else len(v) for v in self._valid_answers], dtype=int)
+
+        self.sel_mask = dict()
+        for sel in selectors:
+            self.sel_mask[sel] = np.array([t is not None and t.type == sel for t in mssp_engine._targets],
+                                          dtype=bool)
+
+        self._build_palette(mssp_engine.colormap)
+        self._build_criteria(mssp_engine._criteria)
+        self._build_caveats(mssp_engine._caveats)
+        self._build_scope()
+
+    @staticmethod
+    def _index_column(series, missing):
+        """
+        Convert an answer index column into an int array, with UNPARSED entries replaced by 'missing'
+        """
+        values = series.values.astype(int)
+        values[values == UNPARSED] = missing
+        return values
+
+    @staticmethod
+    def _group_rows(keys, order):
+        """
+        Given row keys and a stable ordering of rows by key, return the start offsets of each key's rows
+        :param keys: array of row keys (TargetIDs)
+        :param order: permutation of rows, sorted by key
+        :return: offsets array such that rows for key k are order[offsets[k]:offsets[k+1]]
+        """
+        return np.searchsorted(keys[order], np.arange(keys.max() + 2 if len(keys) else 1))
+
+    def _build_criteria(self, criteria):
+        never = self.n_answers  # no answer index can reach this threshold
+        self._cri_q = criteria['QuestionID'].values.astype(int)
+        self._cri_t = criteria['TargetID'].values.astype(int)
+        self._cri_thresh = self._index_column(criteria['Threshold'], never)
+
+        self.thresholds = np.full((self.n_questions, self.n_targets), never, dtype=int)
+        np.minimum.at(self.thresholds, (self._cri_q, self._cri_t), self._cri_thresh)
+        self.linked = np.zeros((self.n_questions, self.n_targets), dtype=bool)
+        self.linked[self._cri_q, self._cri_t] = True
+        self.passing = self.linked[:, None, :] & (np.arange(self.n_answers)[None, :, None] >=
+                                                  self.thresholds[:, None, :])
+
+        # profile listings are sorted by QuestionID within each target, ties kept in table order
+        self._cri_order = np.lexsort((np.arange(len(self._cri_q)), self._cri_q, self._cri_t))
+        self._cri_offsets = self._group_rows(self._cri_t, self._cri_order)
+
+    def _build_palette(self, colormap):
+        """
+        Integer color codes in colormap row order
+        :param colormap: the engine's Colormap
+        """
+        self._colormap = colormap
+        self.color_names = list(colormap.names)
+        self.color_scores = np.array(colormap.scores)
+
+    def color_code(self, rgb):
+        return self._colormap.code(rgb)
+
+    def color_score(self, color):
+        """
+        Colormap score of a color name (as used for the keys of a profile's 'Caveats')
+        """
+        return self._colormap.score(color)
+
+    def _build_caveats(self, caveats):
+        self._cav_q = caveats['QuestionID'].values.astype(int)
+        self._cav_t = caveats['TargetID'].values.astype(int)
+        self._cav_a = self._index_column(caveats['Answer'], UNANSWERED)  # unparsed answers match nothing
+
+        # encode each distinct note once
+        note_ids, rows = np.unique(caveats['NoteID'].values, return_inverse=True)
+        elements = [self._engine._notes[k] for k in self._engine._note_codes.decode(note_ids)]
+        note_text = [e.text for e in elements]
+        note_code = np.array([self.color_code(e.fill_color) for e in elements], dtype=int)
+
+        self._cav_note = [note_text[i] for i in rows]
+        self._cav_code = note_code[rows] if len(rows) else np.zeros(0, dtype=int)
+        self._cav_score = self.color_scores[self._cav_code]
+
+        valid = self._cav_a != UNANSWERED
+        self.caveat_scores = np.zeros((self.n_questions, self.n_answers, self.n_targets),
+                                      dtype=self.color_scores.dtype)
+        np.add.at(self.caveat_scores, (self._cav_q[valid], self._cav_a[valid], self._cav_t[valid]),
+                  self._cav_score[valid])
+        self._cav_questions = np.unique(self._cav_q[valid])
+
+        self._cav_order = np.argsort(self._cav_t, kind='mergesort')
+        self._cav_offsets = self._group_rows(self._cav_t, self._cav_order)
+
+    def _build_scope(self):
+        """
+        Monitoring targets must pass every Monitoring criteria question, linked or not; Assessment targets only
+        the questions linked to them; ControlRules targets have no criteria.
+        """
+        self.has_sel = np.zeros(self.n_targets, dtype=bool)
+        for sel in selectors:
+            self.has_sel |= self.sel_mask[sel]
+        self.scope = self.linked & self.sel_mask['Assessment'][None, :]
+        self.scope[np.ix_(self.criteria_questions('Monitoring'), np.flatnonzero(self.sel_mask['Monitoring']))] = True
+        self.scope_targets = [np.flatnonzero(row) for row in self.scope]
+
+        # targets that no valid answer can pass, and targets whose outcome depends on the answer given
+        self.certain_fail = self.scope & (self.thresholds >= self.n_valid[:, None])
+        self.decidable = self.scope & (self.thresholds > 0) & ~self.certain_fail
+
+        self.caveat_linked = np.zeros((self.n_questions, self.n_targets), dtype=bool)
+        self.caveat_linked[self._cav_q, self._cav_t] = True
+        self.caveat_targets = [np.flatnonzero(row) for row in self.caveat_linked]
+
+    def _rows_for(self, offsets, order, target):
+        if target + 1 >= len(offsets):
+            return order[:0]
+        return order[offsets[target]:offsets[target + 1]]
+
+    def answer_text(self, question, answer):
+        if answer == UNANSWERED:
+            return '--'
+        return self._valid_answers[question][answer]
+
+    def answer_vector(self, answers):
+        """
+        Encode an answers dict as a vector of answer indices over QuestionIDs
+        :param answers: dict of QuestionID: answer index (as in FisheryGuide._answers)
+        :return: int array of length n_questions, with UNANSWERED for missing questions
+        """
+        vec = np.full(self.n_questions, UNANSWERED, dtype=int)
+        for q, a in answers.items():
+            vec[int(q)] = int(a)
+        return vec
+
+    def answer_matrix(self, profiles):
+        """
+        Encode a sequence of answers dicts as a (profiles x questions) matrix of answer indices
+        :param profiles: iterable of answers dicts
+        :return: 2-D int array
+        """
+        return np.array([self.answer_vector(p) for p in profiles], dtype=int).reshape(-1, self.n_questions)
+
+    @staticmethod
+    def _as_matrix(answers):
+        answers = np.asarray(answers, dtype=int)
+        return answers.reshape(-1, answers.shape[-1]), answers.ndim == 1
+
+    def linked_targets(self, question):
+        """
+        Bool vector over TargetIDs of targets having a criterion on the question
+        """
+        return self.linked[question]
+
+    def passing_targets(self, question, answer):
+        """
+        Bool vector over TargetIDs of targets whose criterion on the question is met by the answer.  Equivalent to
+        the index of MsspDataStore.criteria(question, answer=...) but without building any DataFrames.
+        :param question: QuestionID
+        :param answer: answer index
+        :return:
+        """
+        if answer == UNANSWERED:
+            return np.zeros(self.n_targets, dtype=bool)
+        return self.passing[question, answer]
+
+    def caveat_score(self, question, answer, targets):
+        """
+        Caveat score contributed by one question's answer to the given targets
+        """
+        if answer == UNANSWERED:
+            return np.zeros(len(targets), dtype=self.caveat_scores.dtype)
+        return self.caveat_scores[question, answer, targets]
+
+    def passing_matrix(self, answers):
+        """
+        Bool (questions x targets) array of criteria met by a single answer vector
+        """
+        answers = np.asarray(answers, dtype=int)
+        passing = self.passing[np.arange(self.n_questions), np.maximum(answers, 0), :]
+        passing &= (answers != UNANSWERED)[:, None]
+        return passing
+
+    def criteria_questions(self, sel):
+        """
+        QuestionIDs with criteria linked to targets of the given selector (cf. MsspDataStore.criteria_for)
+        """
+        return np.flatnonzero(self.linked[:, self.sel_mask[sel]].any(axis=1))
+
+    def qualifying(self, answers, sel):
+        """
+        Apply the FisheryGuide.filter rules to one or more answer profiles.
+        :param answers: answer vector or (profiles x questions) answer matrix
+        :param sel: selector
+        :return: bool array over TargetIDs (or profiles x TargetIDs) of qualifying targets
+        """
+        if not check_sel(sel):
+            raise BadSelectorError('Selector must be one of %s' % list(selectors))
+        a, single = self._as_matrix(answers)
+        qs = self.criteria_questions(sel)
+        given = a[:, qs]
+        passing = self.passing[qs[None, :], np.maximum(given, 0), :] & (given != UNANSWERED)[:, :, None]
+        linked = self.linked[qs][None, :, :]
+        if sel == 'Monitoring':
+            # target must pass every criterion question of the selector
+            ok = (passing & linked).all(axis=1)
+        elif sel == 'Assessment':
+            # targets fail only on criteria that are linked to them
+            ok = (passing | ~linked).all(axis=1)
+        else:
+            # no criteria for control rules - all targets pass
+            ok = np.ones((a.shape[0], self.n_targets), dtype=bool)
+        ok &= self.sel_mask[sel][None, :]
+        if single:
+            return ok[0]
+        return ok
+
+    def scores(self, answers):
+        """
+        Caveat scores of every target under one or more answer profiles.
+        :param answers: answer vector or (profiles x questions) answer matrix
+        :return: int array over TargetIDs (or profiles x TargetIDs)
+        """
+        a, single = self._as_matrix(answers)
+        qs = self._cav_questions
+        given = a[:, qs]
+        gathered = self.caveat_scores[qs[None, :], np.maximum(given, 0), :]
+        gathered *= (given != UNANSWERED)[:, :, None]
+        total = gathered.sum(axis=1)
+        if single:
+            return total[0]
+        return total
+
+    def qualify_target(self, answers, target):
+        """
+        Same output as FisheryGuide.qualify_target, for an answer vector
+        :param answers: answer vector
+        :param target:
+        :return: a list of dicts for criteria, with keys: 'QuestionID', 'Answer', 'Threshold', 'Pass'.  'Pass' is
+         None for criteria on unanswered questions: they were not evaluated.
+        """
+        criteria = []
+        for r in self._rows_for(self._cri_offsets, self._cri_order, target):
+            q = int(self._cri_q[r])
+            thresh = int(self._cri_thresh[r])
+            criteria.append({'QuestionID': q,
+                             'Answer': self.answer_text(q, answers[q]),
+                             'Threshold': self.answer_text(q, thresh),
+                             'Pass': None if answers[q] == UNANSWERED else bool(answers[q] >= thresh)})
+        return criteria
+
+    def score_target(self, answers, target):
+        """
+        Same output as FisheryGuide.score_target, for an answer vector
+        :param answers: answer vector
+        :param target:
+        :return: a dict of color keys containing lists of dicts for notes having that color, with keys
+         'QuestionID', 'Answer', 'Note'
+        """
+        scores = defaultdict(list)
+        for r in self._rows_for(self._cav_offsets, self._cav_order, target):
+            q = int(self._cav_q[r])
+            if self._cav_a[r] != UNANSWERED and self._cav_a[r] == answers[q]:
+                scores[self.color_names[self._cav_code[r]]].append({'QuestionID': q,
+                                                                    'Answer': self.answer_text(q, answers[q]),
+                                                                    'Note': self._cav_note[r]})
+        return dict(scores)
+
+    def profile(self, answers, target, score=None):
+        """
+        Same output as FisheryGuide._profile
+        :param answers: answer vector
+        :param target:
+        :param score: precomputed score for the target (computed if omitted)
+        :return:
+        """
+        target = int(target)
+        profile = dict(TargetID=target, Title=self._engine.title(target=target))
+        profile['Criteria'] = self.qualify_target(answers, target)  # already sorted by QuestionID
+        profile['Pass'] = all([x['Pass'] is True for x in profile['Criteria']])  # unanswered criteria fail here
+        if profile['Pass']:
+            profile['Caveats'] = self.score_target(answers, target)
+            if score is None:
+                score = self.scores(answers)[target]
+            profile['Score'] = _native(score)
+        return profile
+
+    def fail_counts(self, answers):
+        """
+        Number of in-scope criteria each target fails on answered questions.  Unanswered criteria are not counted:
+        they were not evaluated (whether they disqualify a target is up to qualifying()).
+        """
+        answers = np.asarray(answers, dtype=int)
+        return (self.scope & ~self.passing_matrix(answers) & (answers != UNANSWERED)[:, None]).sum(axis=0)
+
+    @staticmethod
+    def rank(targets, keys, top_k=None):
+        """
+        Order targets by ascending key without sorting more than needed.
+        :param targets: iterable of TargetIDs
+        :param keys: function of TargetID returning a sort key (ties are broken by TargetID)
+        :param top_k: if given, return only the first top_k targets
+        :return: generator of TargetIDs
+        """
+        keyed = [(keys(t), int(t)) for t in targets]
+        if top_k is not None:
+            for k, t in heapq.nsmallest(top_k, keyed):
+                yield t
+            return
+        heapq.heapify(keyed)
+        while len(keyed) > 0:
+            yield heapq.heappop(keyed)[1]
+
+    def ranked_profiles(self, answers, targets, qualifying=True, top_k=None, scores=None):
+        """
+        Profiles of the given targets, best first, built only as they are consumed.  Qualifying targets are ranked
+        by descending score; non-qualifying targets by fewest criteria failed on answered questions, then
+        descending score.
+        :param answers: answer vector
+        :param targets: iterable of TargetIDs
+        :param qualifying: whether targets are qualifying targets
+        :param top_k: stop after this many profiles
+        :param scores: precomputed scores(answers)
+        :return: generator of profile dicts
+        """
+        if scores is None:
+            scores = self.scores(answers)
+        if qualifying:
+            keys = lambda t: -_native(scores[t])
+        else:
+            fails = self.fail_counts(answers)
+            keys = lambda t: (int(fails[t]), -_native(scores[t]))
+        for t in self.rank(targets, keys, top_k=top_k):
+            yield self.profile(answers, t, scores[t])
+
+    def caveat_questions(self, sel):
+        """
+        QuestionIDs with caveats on targets of the given selector (cf. MsspDataStore.caveats_for)
+        """
+        return np.flatnonzero(self.caveat_linked[:, self.sel_mask[sel]].any(axis=1))
+
+    def sensitivity(self, answers, sel, questions=None):
+        """
+        For every question and every valid answer to it, the change in each target's qualification and score
+        relative to the given answer profile, with everything else held fixed.  Changing a satisfier also changes
+        the derived questions downstream of it, and that is included.
+        :param answers: answer vector
+        :param sel: selector
+        :param questions: QuestionIDs to sweep (default: the non-derived questions behind the selector's criteria
+         and caveat questions)
+        :return: an answerSensitivity with fields:
+         questions - QuestionIDs swept (rows)
+         targets - TargetIDs of the selector (columns)
+         valid - bool (questions x answers) mask of valid answer indices
+         qualifying - int8 (questions x answers x targets): +1 target would enter the qualifying set, -1 leave it
+         scores - (questions x answers x targets) change in caveat score
+        """
+        if not check_sel(sel):
+            raise BadSelectorError('Selector must be one of %s' % list(selectors))
+        answers = np.asarray(answers, dtype=int)
+        graph = self._engine.satisfied_by_graph()
+        if questions is None:
+            relevant = set(self.criteria_questions(sel).tolist()) | set(self.caveat_questions(sel).tolist())
+            questions = set()
+            for q in relevant:
+                questions.update(graph.base_questions(q))
+        qs = np.array(sorted(questions), dtype=int)
+
+        fail_now = self.scope & ~self.passing_matrix(answers)
+        fails = fail_now.sum(axis=0)
+        qualifying = self.sel_mask[sel] & (fails == 0)
+
+        # per-question contributions are additive: swap the current answer's contribution for the alternative's
+        d_fail = (self.scope[qs][:, None, :] & ~self.passing[qs]).astype(int) - fail_now[qs][:, None, :]
+        current = answers[qs]
+        score_now = self.caveat_scores[qs, np.maximum(current, 0), :] * (current != UNANSWERED)[:, None]
+        d_score = self.caveat_scores[qs] - score_now[:, None, :]
+
+        # answers to derived questions follow their satisfiers
+        given = dict((q, a) for q, a in enumerate(answers.tolist()) if a != UNANSWERED)
+        all_targets = np.arange(self.n_targets)
+        for i, q in enumerate(qs.tolist()):
+            if len(graph.downstream(q)) == 0:
+                continue
+            for a in range(self.n_valid[q]):
+                trial = dict(given)
+                trial[q] = a
+                for d, value in graph.propagate(trial, q):
+                    value = UNANSWERED if value is None else value
+                    d_fail[i, a] += (self.scope[d] & ~self.passing_targets(d, value)).astype(int) - fail_now[d]
+                    d_score[i, a] += (self.caveat_score(d, value, all_targets) -
+                                      self.caveat_score(d, answers[d], all_targets))
+
+        entered = (fails[None, None, :] + d_fail == 0) & self.sel_mask[sel][None, None, :]
+        d_qual = entered.astype(np.int8) - qualifying.astype(np.int8)[None, None, :]
+
+        valid = np.arange(self.n_answers)[None, :] < self.n_valid[qs][:, None]
+        d_qual[~valid] = 0
+        d_score[~valid] = 0
+        targets = np.flatnonzero(self.sel_mask[sel])
+        return answerSensitivity(qs, targets, valid, d_qual[:, :, targets], d_score[:, :, targets])
+
+    def _report(self, answers, qualifying, scores, sel, name):
+        tids = np.flatnonzero(qualifying)
+        non_tids = np.flatnonzero(self.sel_mask[sel] & ~qualifying)
+        q_profiles = sorted([self.profile(answers, t, scores[t]) for t in tids], key=lambda x: x['Score'])
+        return {
+            'FisheryGuide': name,
+            'Selector': sel,
+            'QualifyingTargets': q_profiles,
+            'NonQualifyingTargets': [self.profile(answers, t, scores[t]) for t in non_tids]
+        }
+
+    def guide(self, answers, sel, name=None):
+        """
+        Non-interactive equivalent of FisheryGuide.guide() for a single answer profile.
+        :param answers: answers dict or answer vector
+        :param sel: selector
+        :param name: value for the report's 'FisheryGuide' field
+        :return: a dictionary containing a score report
+        """
+        if isinstance(answers, dict):
+            answers = self.answer_vector(answers)
+        return self._report(answers, self.qualifying(answers, sel), self.scores(answers), sel, name)
+
+    def guide_many(self, profiles, sel, names=None):
+        """
+        Evaluate many answer profiles at once.  Qualification and scoring are computed for all profiles in a
+        single pass; profile dicts are then built for each report.
+        :param profiles: sequence of answers dicts, or a (profiles x questions) answer matrix
+        :param sel: selector
+        :param names: optional sequence of names for the reports' 'FisheryGuide' fields
+        :return: list of score reports, one per profile
+        """
+        if isinstance(profiles, np.ndarray):
+            a = profiles.reshape(-1, self.n_questions)
+        else:
+            a = self.answer_matrix(profiles)
+        if names is None:
+            names = [None] * a.shape[0]
+        qualifying = self.qualifying(a, sel)
+        scores = self.scores(a)
+        return [self._report(a[i], qualifying[i], scores[i], sel, names[i]) for i in range(a.shape[0])]
+
+
+class CriteriaScheduler(object):
+    """
+    Chooses which criteria question to ask next while filtering targets of one selector.
+
+    Candidates that fail a pending question whatever the answer (e.g. Monitoring targets with no criterion on
+    it) are eliminated up front.  Each remaining question is ranked by the number of candidates whose outcome
+    depends on its answer; questions with none are never asked.  Once no pending question has any, the
+    candidate set is final.
+    """
+    def __init__(self, scoring, sel, questions):
+        """
+
+        :param scoring: a ScoringEngine
+        :param sel: selector
+        :param questions: the selector's criteria QuestionIDs
+        """
+        self.scoring = scoring
+        self.candidates = scoring.sel_mask[sel].copy()
+        self.pending = np.array(sorted(questions), dtype=int)
+        if len(self.pending) > 0:
+            self.candidates &= ~scoring.certain_fail[self.pending].any(axis=0)
+
+    def apply(self, question, answer):
+        """
+        Apply an answer to a pending question
+        :param question: QuestionID
+        :param answer: answer index (or UNANSWERED, which fails every target in scope)
+        :return: number of candidates eliminated
+        """
+        before = self.candidates.sum()
+        self.candidates &= self.scoring.passing_targets(question, answer) | ~self.scoring.scope[question]
+        self.pending = self.pending[self.pending != question]
+        return before - self.candidates.sum()
+
+    def eliminable(self):
+        """
+        Number of candidates each pending question could still eliminate
+        :return: int array aligned with self.pending
+        """
+        if len(self.pending) == 0:
+            return np.zeros(0, dtype=int)
+        return (self.scoring.decidable[self.pending] & self.candidates[None, :]).sum(axis=1)
+
+    def next_question(self):
+        """
+        The pending question that could eliminate the most candidates (lowest QuestionID on ties).  Once no
+        answer can eliminate a candidate, the pending questions still in scope for a candidate are returned in
+        QuestionID order: every answer to them passes, but an unanswered criterion fails.  None when no pending
+        question bears on any candidate.
+        """
+        counts = self.eliminable()
+        if len(counts) == 0:
+            return None
+        if counts.max() > 0:
+            return int(self.pending[np.argmax(counts)])
+        open_ = (self.scoring.scope[self.pending] & self.candidates[None, :]).any(axis=1)
+        if not open_.any():
+            return None
+        return int(self.pending[np.argmax(open_)])
+
+    def qualifying(self):
+        return np.flatnonzero(self.candidates).tolist()
+
+
+class IncrementalScorer(object):
+    """
+    Running qualification and score state for one answer profile.
+
+    fail_counts[t] is the number of in-scope criteria that target t currently fails (a target qualifies when it
+    is zero) and scores[t] is its caveat score total.  set_answer() updates both for the targets linked to the
+    changed question only, and reports which targets entered or left the qualifying set and whose scores moved.
+    """
+    def __init__(self, scoring, answers):
+        """
+
+        :param scoring: a ScoringEngine
+        :param answers: answers dict or answer vector
+        """
+        self.scoring = scoring
+        if isinstance(answers, dict):
+            answers = scoring.answer_vector(answers)
+        self.answers = np.array(answers, dtype=int)
+        self.fail_counts = (scoring.scope & ~scoring.passing_matrix(self.answers)).sum(axis=0)
+        self.scores = scoring.scores(self.answers)
+
+    def _qualifies(self, targets):
+        return (self.fail_counts[targets] == 0) & self.scoring.has_sel[targets]
+
+    def qualifying(self, sel):
+        """
+        Sorted list of qualifying TargetIDs for the selector, consistent with ScoringEngine.qualifying
+        """
+        return np.flatnonzero(self.scoring.sel_mask[sel] & (self.fail_counts == 0)).tolist()
+
+    def set_answer(self, question, answer):
+        """
+        Change one answer and update the affected targets
+        :param question: QuestionID
+        :param answer: answer index (or UNANSWERED)
+        :return: an answerDelta with sorted lists of TargetIDs that entered / left the qualifying set and a dict of
+         TargetID: (old score, new score) for targets whose score changed
+        """
+        old = self.answers[question]
+        if old == answer:
+            return answerDelta([question], [], [], dict())
+        self.answers[question] = answer
+
+        ts = self.scoring.scope_targets[question]
+        was = self._qualifies(ts)
+        self.fail_counts[ts] += (self.scoring.passing_targets(question, old)[ts].astype(int) -
+                                 self.scoring.passing_targets(question, answer)[ts].astype(int))
+        now = self._qualifies(ts)
+
+        cs = self.scoring.caveat_targets[question]
+        change = self.scoring.caveat_score(question, answer, cs) - self.scoring.caveat_score(question, old, cs)
+        moved = change != 0
+        before = self.scores[cs[moved]].copy()
+        self.scores[cs] += change
+
+        return answerDelta([question],
+                           ts[~was & now].tolist(),
+                           ts[was & ~now].tolist(),
+                           dict((int(t), (_native(b), _native(self.scores[t]))) for t, b in zip(cs[moved], before)))
+
+    @staticmethod
+    def merge_deltas(deltas):
+        """
+        Combine successive deltas (e.g. an answer and the answers derived from it) into one
+        """
+        questions = []
+        qualifying = dict()  # TargetID: (was qualifying, is qualifying)
+        scores = dict()
+        for d in deltas:
+            questions.extend(d.questions)
+            for t in d.entered:
+                qualifying[t] = (qualifying.get(t, (False, None))[0], True)
+            for t in d.left:
+                qualifying[t] = (qualifying.get(t, (True, None))[0], False)
+            for t, (b, a) in d.scores.items():
+                scores[t] = (scores.get(t, (b, None))[0], a)
+        return answerDelta(questions,
+                           sorted(t for t, (b, a) in qualifying.items() if a and not b),
+                           sorted(t for t, (b, a) in qualifying.items() if b and not a),
+                           dict((t, v) for t, v in scores.items() if v[0] != v[1]))
@@ -7,38 +7,108 @@ from __future__ import print_function, unicode_literals
 
 import uuid
 import re
+from collections import OrderedDict
 
 from MSSP.exceptions import MsspError
 from MSSP.elements import Element
+from MSSP.text_index import TextIndex
+from MSSP.near_duplicates import find_near_duplicates
+from MSSP.colormap import Colormap
 
 
 fill_color_re = re.compile('[0-9A-F]{8}')
 
+_pattern_cache = OrderedDict()
+pattern_cache_size = 256
+
+
+def compile_pattern(string):
+    """
+    Compiled case-insensitive search pattern, from a least-recently-used cache
+    :param string: regex
+    :return: compiled regex
+    """
+    try:
+        pattern = _pattern_cache.pop(string)
+    except KeyError:
+        pattern = re.compile(string, flags=re.IGNORECASE | re.U)
+        if len(_pattern_cache) >= pattern_cache_size:
+            _pattern_cache.popitem(last=False)
+    _pattern_cache[string] = pattern
+    return pattern
+
+
+def casefold(text):
+    return unicode(text).lower()
+
+
+_palette = []  # fill colors by code, shared by every element set
+_palette_codes = dict()
+_texts = dict()
+
+
+def color_code(fill_color):
+    """
+    Small-integer code for a fill color, assigned on first sight
+    """
+    try:
+        return _palette_codes[fill_color]
+    except KeyError:
+        _palette_codes[fill_color] = len(_palette)
+        _palette.append(fill_color)
+        return _palette_codes[fill_color]
+
+
+def intern_text(text):
+    """
+    One shared copy of each distinct element text, so that snapshots loaded side by side (and the reverse keys
+    of each set) do not hold their own copies
+    """
+    if text is None:
+        return None
+    return _texts.setdefault(text, text)
+
+
+def check_color(fill_color):
+    """
+    The fill color if it is an 8-digit RGB string, else '00000000'
+    """
+    if fill_color is None:
+        return '00000000'
+    try:
+        if not bool(fill_color_re.match(fill_color)):
+            return '00000000'
+    except TypeError:
+        print('Type fail %s' % type(fill_color))
+        return '00000000'
+    return fill_color
+
 
 class SemanticElement(object):
     """
     A referenceable atom of semantic content with two dimensions: text (unicode) and fill_color.
     An element has its own UUID which can be specified at initialization or else is created at random.
+
+    The fill color is stored as a code into a palette shared by all elements.
     """
+    __slots__ = ('text', '_color')
+
     def __init__(self, text, fill_color=None):
         """
 
         :param text:
         :param fill_color:
         """
-        self.text = text
-        if fill_color is None:
-            fill_color = '00000000'
-        else:
-            try:
-                chk = bool(fill_color_re.match(fill_color))
-                if not chk:
-                    fill_color = '00000000'
-            except TypeError:
-                print('Type fail %s' % type(fill_color))
-                fill_color = '00000000'
+        self.text = intern_text(text)
+        self.fill_color = check_color(fill_color)
 
-        self.fill_color = fill_color
+    @property
+    def fill_color(self):
+        return _palette[self._color]
+
+    @fill_color.setter
+    def fill_color(self, value):
+        self._color = color_code(value)
 
     def search(self, string):
         """
@@ -46,7 +116,7 @@ class SemanticElement(object):
         :param string: regex
         :return: bool
         """
-        return bool(re.search(string, unicode(self.text), flags=re.IGNORECASE | re.U))
+        return bool(compile_pattern(string).search(unicode(self.text)))
 
     def __str__(self):
         return self.text or 'no text'
@@ -62,7 +132,11 @@ class SemanticElementSet(object):
     Internals:
         obj._ns_uuid = namespace UUID
         obj._d[key] = value, where key is a UUID, value is a SemanticElement
-        obj._rd[string] = key, where string is self._element_to_string(value), key is a UUID
+        obj._rd[(color, text)] = key, where color is the palette code of value's fill_color and text is value.text
+        obj._keys = list of keys in order of addition
+        obj._pos[key] = position of key in obj._keys
+        obj._folded[i] = casefolded text of element obj._keys[i], for search()
+        obj._index = TextIndex over element text, or None until build_index() is called
 
     Methods:
         class.from_element_set(element_set) - creates a SemanticElementSet from an old-style (spreadsheet) ElementSet
@@ -74,12 +148,20 @@ class SemanticElementSet(object):
         obj[index] = element - creates or updates the string with the given UUID index - updates _d and _rd
 
         obj.add_element(text, fill_color)
+
+        obj.near_duplicates(threshold) - clusters of elements whose texts differ only slightly
+
+        obj.build_index() - maintain a token index of element text, used by search() and search_tokens()
     """
     def __init__(self, ns_uuid=None, colormap=None):
         self._d = dict()
         self._rd = dict()  # reverse dictionary
+        self._keys = []
+        self._pos = dict()
+        self._folded = []
         self.dups = []
-        self._colormap = colormap
+        self._colormap = Colormap.coerce(colormap)
+        self._index = None
         if ns_uuid is not None:
             if isinstance(ns_uuid, uuid.UUID):
                 self._ns_uuid = ns_uuid
@@ -92,16 +174,36 @@ class SemanticElementSet(object):
         self[self._index_from_element(element)] = element
 
     def _lookup_rgb(self, color, field='ColorName'):
-        try:
-            return self._colormap[self._colormap[field] == color]['RGB'].iloc[0]
-        except IndexError:
-            raise KeyError('Key %s was not found in colormap column %s' % (color, field))
+        if field == 'RGB':
+            if color not in self._colormap:
+                raise KeyError('Key %s was not found in colormap column %s' % (color, field))
+            return color
+        return self._colormap.rgb(color)
+
+    @property
+    def colormap(self):
+        return self._colormap
+
+    def set_colormap(self, colormap, check=True):
+        """
+        Read the elements' fill colors through a different colormap.  Elements are not changed, so every fill color
+        in use must be in the new colormap.
+        :param colormap: a Colormap (or a DataFrame or list of rows to build one from)
+        :param check: (default True) raise MsspError if an element's fill color is not in the colormap
+        :return:
+        """
+        colormap = Colormap.coerce(colormap)
+        if check and colormap is not None:
+            missing = colormap.missing(v.fill_color for v in self._d.values())
+            if len(missing) > 0:
+                raise MsspError('Fill colors %s are not in the new colormap' % ', '.join(missing))
+        self._colormap = colormap
 
     @classmethod
     def from_element_set(cls, element_set):
         the_set = cls()
-        for element in element_set:
-            the_set.add_element(element.text, element.fill_color)
+        elements = list(element_set)
+        the_set.bulk_load([e.text for e in elements], [e.fill_color for e in elements])
         return the_set
 
     @classmethod
@@ -113,18 +215,23 @@ class SemanticElementSet(object):
         :return:
         """
         the_set = cls(ns_uuid=json_in['nsUuid'], colormap=colormap)
-        for i in json_in['Elements']:
-            if colormap is None:
-                i_id = uuid.UUID(i['AttributeID'])
-                i_txt = i['AttributeText']
-                the_set[i_id] = SemanticElement(text=i_txt)
-            else:
-                i_id = uuid.UUID(i['NoteID'])
-                i_txt = i['NoteText']
-                rgb = the_set._lookup_rgb(i['NoteColor'])
-                the_set[i_id] = SemanticElement(text=i_txt, fill_color=rgb)
+        colormap = the_set.colormap
+        elements = json_in['Elements']
+        if colormap is None:
+            the_set.bulk_load([i['AttributeText'] for i in elements],
+                              keys=[uuid.UUID(i['AttributeID']) for i in elements])
+        else:
+            the_set.bulk_load([i['NoteText'] for i in elements],
+                              [colormap.rgb(i['NoteColor']) for i in elements],
+                              keys=[uuid.UUID(i['NoteID']) for i in elements])
         return the_set
 
+    @staticmethod
+    def _reverse_key(element):
+        if isinstance(element, SemanticElement):
+            return element._color, element.text
+        return color_code(element.fill_color), element.text
+
     @staticmethod
     def _string_from_element(element):
         return 'color[%s] text[%s]' % (element.fill_color, element.text)
@@ -137,7 +244,7 @@ class SemanticElementSet(object):
             raise
 
     def get_index(self, element):
-        return self._rd[self._string_from_element(element)]
+        return self._rd[self._reverse_key(element)]
 
     def __len__(self):
         return len(self._d)
@@ -160,41 +267,116 @@ class SemanticElementSet(object):
             key = uuid.UUID(key)
         if not isinstance(value, SemanticElement):
             value = SemanticElement(value.text, fill_color=value.fill_color)
-        rkey = self._string_from_element(value)
+        rkey = self._reverse_key(value)
         if rkey in self._rd:  # duplicate values not allowed
             if key != self._rd[rkey]:
-                print('Value %s already exists\nold key %s\nnew key %s' % (rkey, self._rd[rkey], key))
+                print('Value %s already exists\nold key %s\nnew key %s' % (self._string_from_element(value),
+                                                                          self._rd[rkey], key))
                 self.dups.append((key, self._rd[rkey]))
                 return
             else:
                 assert key in self._d
         if key in self._d:  # updates ARE allowed - but we need to delete the old reverse-key mapping
-            chk_key = self._rd.pop(self._string_from_element(self._d[key]))
+            chk_key = self._rd.pop(self._reverse_key(self._d[key]))
             assert chk_key == key, 'Corrupt dict found!'
 
         self._d[key] = value
         self._rd[rkey] = key
+        if key in self._pos:
+            self._folded[self._pos[key]] = casefold(value.text)
+        else:
+            self._pos[key] = len(self._keys)
+            self._keys.append(key)
+            self._folded.append(casefold(value.text))
+        if self._index is not None:
+            self._index.add(key, value.text)
 
     def keys(self):
         return self._d.keys()
 
+    def build_index(self):
+        """
+        Index the text of every element.  From here on, the index is kept up to date as elements are added or
+        updated, and search() uses it to skip elements that cannot match a plain search string.
+        :return:
+        """
+        self._index = TextIndex((k, v.text) for k, v in self._d.items())
+
+    def drop_index(self):
+        self._index = None
+
+    @property
+    def indexed(self):
+        return self._index is not None
+
+    def _positions(self, candidates):
+        """
+        Positions to scan, in order of addition
+        :param candidates: iterable of keys, or None for all
+        """
+        if candidates is None:
+            return xrange(len(self._keys))
+        return sorted(self._pos[k] for k in candidates if k in self._pos)
+
+    def _candidates(self, strings, idx=None):
+        """
+        Keys that can match any of the strings: the text index's candidates (when it can serve every string),
+        restricted to idx.  None means every element.
+        """
+        candidates = None
+        if self._index is not None:
+            for string in strings:
+                found = self._index.candidates(string)
+                if found is None:
+                    candidates = None  # regex: scan every element
+                    break
+                candidates = found if candidates is None else candidates | found
+        if idx is not None:
+            idx = set(idx)
+            candidates = idx if candidates is None else candidates & idx
+        return candidates
+
     def search(self, string, idx=None):
         """
-        Search the element set for a plain string or regex. returns a list of indices
+        Search the element set for a plain string or regex. returns a list of indices, in order of addition
         :param string: the search term
-        :param idx: (default:None) a set of indices to search within-- returns the intersection
+        :param idx: (default:None) a set of indices to search within-- only these are scanned
         :return:
         """
-        ind = []
-        type(string)
-        for k, v in self._d.items():
-            if v.search(string) is True:
-                ind.append(k)
+        pattern = compile_pattern(string)
+        return [self._keys[i] for i in self._positions(self._candidates([string], idx))
+                if pattern.search(self._folded[i])]
 
-        if idx is None:
-            return ind
-
-        return list(set(ind).intersection(idx))
+    def search_terms(self, strings, idx=None):
+        """
+        Search for several plain strings or regexes in one pass over the text.
+        :param strings: list of search terms
+        :param idx: (default:None) a set of indices to search within-- only these are scanned
+        :return: a list, parallel to strings, of lists of indices in order of addition
+        """
+        patterns = [compile_pattern(string) for string in strings]
+        found = [[] for string in strings]
+        for i in self._positions(self._candidates(strings, idx)):
+            text = self._folded[i]
+            for j, pattern in enumerate(patterns):
+                if pattern.search(text):
+                    found[j].append(self._keys[i])
+        return found
+
+    def search_tokens(self, query, idx=None):
+        """
+        Word search for search-as-you-type: finds elements containing every word in the query, with the last word
+        matching as a prefix and double-quoted parts matching as phrases.  Builds the index if needed.
+        :param query: the search string
+        :param idx: (default:None) a set of indices to search within-- returns the intersection
+        :return: a list of indices, in order of addition
+        """
+        if self._index is None:
+            self.build_index()
+        ind = self._index.query(query)
+        if idx is not None:
+            ind &= set(idx)
+        return [self._keys[i] for i in self._positions(ind)]
 
     def find_string(self, string):
         """
@@ -204,6 +386,76 @@ class SemanticElementSet(object):
         """
         return [k for k, v in self._d.items() if v.text == string]
 
+    def near_duplicates(self, threshold=0.8, same_color=True, **kwargs):
+        """
+        Find clusters of elements whose texts are nearly the same, e.g. differing only in punctuation or spacing.
+        Unlike the exact duplicates in self.dups, these are not rejected on entry; it is up to the curator to
+        accept them (see MsspDataStore.remap_duplicate_attribute_references).
+        :param threshold: minimum similarity (Jaccard similarity of character trigrams of the normalized texts)
+        :param same_color: (default True) only compare elements with the same fill_color
+        :param kwargs: passed to near_duplicates.find_near_duplicates
+        :return: list of DuplicateClusters of element keys, largest first
+        """
+        items = ((k, v.text, v.fill_color if same_color else None) for k, v in self._d.items())
+        return find_near_duplicates(items, threshold=threshold, **kwargs)
+
+    def bulk_load(self, texts, fill_colors=None, keys=None):
+        """
+        Add many elements in one pass.  With keys, this is equivalent to self[key] = SemanticElement(text, color)
+        for each element in turn: an element whose text and color are already present under another key is not
+        added, and is recorded in self.dups.  Without keys, it is equivalent to add_element(text, color) for each.
+        Each distinct color is validated once, and new elements go straight into the dicts.
+        :param texts: list of element texts
+        :param fill_colors: (default: all None) list of fill colors, parallel to texts
+        :param keys: (default: None) list of UUIDs, parallel to texts; if None, keys are derived as in
+         add_element
+        :return: list of the keys under which the elements are found, parallel to texts
+        """
+        texts = [intern_text(t) for t in texts]
+        if fill_colors is None:
+            fill_colors = [None] * len(texts)
+        codes = dict((c, color_code(check_color(c))) for c in set(fill_colors))
+        colors = [codes[c] for c in fill_colors]
+        adding = keys is None
+        if adding:
+            ns_uuid = self._ns_uuid
+            keys = [uuid.uuid3(ns_uuid, ('color[%s] text[%s]' % (_palette[c], t)).encode('utf-8'))
+                    for t, c in zip(texts, colors)]
+        else:
+            keys = [k if isinstance(k, uuid.UUID) else uuid.UUID(k) for k in keys]
+
+        d = self._d
+        rd = self._rd
+        pos = self._pos
+        new = SemanticElement.__new__
+        append_key = self._keys.append
+        append_folded = self._folded.append
+        found = []
+        for key, text, c in zip(keys, texts, colors):
+            rkey = (c, text)
+            if rkey in rd:
+                if key != rd[rkey] and not adding:  # duplicate values not allowed
+                    print('Value %s already exists\nold key %s\nnew key %s' % (
+                        'color[%s] text[%s]' % (_palette[c], text), rd[rkey], key))
+                    self.dups.append((key, rd[rkey]))
+                found.append(rd[rkey])
+                continue
+            element = new(SemanticElement)
+            element.text = text
+            element._color = c
+            if key in d:  # an update
+                self[key] = element
+            else:
+                d[key] = element
+                rd[rkey] = key
+                pos[key] = len(pos)
+                append_key(key)
+                append_folded(casefold(text))
+                if self._index is not None:
+                    self._index.add(key, text)
+            found.append(key)
+        return found
+
     def add_element(self, text, fill_color=None):
         """
         creates a semantic element then adds it if it doesn't already exist
@@ -243,8 +495,8 @@ class SemanticElementSet(object):
 
     def test_dict_integrity(self):
         for key in self.keys():
-            rkey = self._string_from_element(self._d[key])
+            rkey = self._reverse_key(self._d[key])
             assert self._rd[rkey] == key, 'key %s failure' % key
         for rkey in self._rd.keys():
             key = self._rd[rkey]
-            assert self._string_from_element(self._d[key]) == rkey, 'rkey %s failure' % rkey
+            assert self._reverse_key(self._d[key]) == rkey, 'rkey %s failure' % (rkey,)
@@ -0,0 +1,244 @@
+"""
+SQLite storage for engine snapshots.
+
+A snapshot database holds the same content as the JSON exchange files, in indexed tables:
+
+ - meta: the attribute and note namespace UUIDs
+ - colormap: RGB, ColorName, Score, in row order
+ - attributes, notes: element UUIDs and text (and, for notes, the fill color RGB)
+ - questions, targets: records, with list-valued fields (valid answers, references, satisfied_by) as JSON text
+ - question_attributes, target_attributes: the attribute maps
+ - criteria, caveats: the mapping tables, with answers stored as indices into the question's valid answers
+
+Answers are parsed into indices once, when the database is written, so loading a snapshot needs no parsing.  The
+attribute and note sets are SqliteElementSets: they read element text from the database on first access and keep
+it in an in-process cache, and only read the whole table when an operation needs every element (search, editing,
+duplicate detection).
+
+To convert a JSON snapshot:
+
+    write_sqlite(MsspFromJson('json/current').serialize(), 'current.db')
+    E = MsspFromSqlite('current.db')
+
+Edits to a loaded engine are made in memory; write them back with write_sqlite(E.serialize(), ...).
+"""
+
+import os
+import json
+import sqlite3
+import uuid
+
+from MSSP.utils import defaultdir
+from MSSP.exceptions import MsspError
+from MSSP.importers import indices
+from MSSP.colormap import Colormap
+from MSSP.semantic_elements import SemanticElement, SemanticElementSet
+
+
+schema = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE colormap (seq INTEGER PRIMARY KEY, RGB TEXT, ColorName TEXT, Score);
+CREATE TABLE attributes (seq INTEGER PRIMARY KEY, id TEXT UNIQUE, text TEXT, color TEXT);
+CREATE TABLE notes (seq INTEGER PRIMARY KEY, id TEXT UNIQUE, text TEXT, color TEXT);
+CREATE TABLE questions (QuestionID INTEGER PRIMARY KEY, Title TEXT, Category TEXT,
+                        ValidAnswers TEXT, Refs TEXT, SatisfiedBy TEXT);
+CREATE TABLE targets (TargetID INTEGER PRIMARY KEY, Title TEXT, Category TEXT, Reference TEXT);
+CREATE TABLE question_attributes (seq INTEGER PRIMARY KEY, QuestionID INTEGER, AttributeID TEXT);
+CREATE TABLE target_attributes (seq INTEGER PRIMARY KEY, TargetID INTEGER, AttributeID TEXT);
+CREATE TABLE criteria (seq INTEGER PRIMARY KEY, QuestionID INTEGER, TargetID INTEGER, Threshold INTEGER);
+CREATE TABLE caveats (seq INTEGER PRIMARY KEY, QuestionID INTEGER, TargetID INTEGER, Answer INTEGER,
+                      NoteID TEXT);
+CREATE INDEX question_attributes_q ON question_attributes (QuestionID);
+CREATE INDEX question_attributes_a ON question_attributes (AttributeID);
+CREATE INDEX target_attributes_t ON target_attributes (TargetID);
+CREATE INDEX target_attributes_a ON target_attributes (AttributeID);
+CREATE INDEX criteria_q ON criteria (QuestionID);
+CREATE INDEX criteria_t ON criteria (TargetID);
+CREATE INDEX caveats_q ON caveats (QuestionID);
+CREATE INDEX caveats_t ON caveats (TargetID);
+CREATE INDEX caveats_n ON caveats (NoteID);
+"""
+
+
+def db_path(filename):
+    """
+    Absolute path of a snapshot database (relative paths are taken from defaultdir)
+    """
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(defaultdir, filename)
+
+
+def _answer_index(valid_answers, answer):
+    found = indices(valid_answers, lambda k: answer == k)
+    if len(found) == 0:
+        return None
+    return found[0]
+
+
+def write_sqlite(json_out, filename):
+    """
+    Write a snapshot database, replacing any existing file.
+    :param json_out: the output of serialize() (or of read_json())
+    :param filename: database file (absolute, or relative to defaultdir)
+    :return: the absolute filename
+    """
+    filename = db_path(filename)
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    questions = dict((q['QuestionID'], q) for q in json_out['questions'])
+
+    db = sqlite3.connect(filename)
+    try:
+        db.executescript(schema)
+        db.executemany('INSERT INTO meta VALUES (?, ?)',
+                       [('attributes_ns', json_out['attributes']['nsUuid']),
+                        ('notes_ns', json_out['notes']['nsUuid'])])
+        db.executemany('INSERT INTO colormap VALUES (?, ?, ?, ?)',
+                       [(i, c['RGB'], c['ColorName'], c['Score']) for i, c in enumerate(json_out['colormap'])])
+        colormap = Colormap.from_json(json_out['colormap'])
+
+        db.executemany('INSERT INTO attributes VALUES (?, ?, ?, ?)',
+                       [(i, a['AttributeID'], a['AttributeText'], '00000000')
+                        for i, a in enumerate(json_out['attributes']['Elements'])])
+        db.executemany('INSERT INTO notes VALUES (?, ?, ?, ?)',
+                       [(i, n['NoteID'], n['NoteText'], colormap.rgb(n['NoteColor']))
+                        for i, n in enumerate(json_out['notes']['Elements'])])
+
+        db.executemany('INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?)',
+                       [(q['QuestionID'], q.get('Title'), q.get('Category'), json.dumps(q['ValidAnswers']),
+                         json.dumps(q['References']),
+                         json.dumps(q['SatisfiedBy']) if 'SatisfiedBy' in q else None)
+                        for q in json_out['questions']])
+        db.executemany('INSERT INTO targets VALUES (?, ?, ?, ?)',
+                       [(t['TargetID'], t.get('Title'), t.get('Category'), json.dumps(t['Reference']))
+                        for t in json_out['targets']])
+        db.executemany('INSERT INTO question_attributes (QuestionID, AttributeID) VALUES (?, ?)',
+                       [(q['QuestionID'], a) for q in json_out['questions'] for a in q['Attributes']])
+        db.executemany('INSERT INTO target_attributes (TargetID, AttributeID) VALUES (?, ?)',
+                       [(t['TargetID'], a) for t in json_out['targets'] for a in t['Attributes']])
+
+        db.executemany('INSERT INTO criteria (QuestionID, TargetID, Threshold) VALUES (?, ?, ?)',
+                       [(c['QuestionID'], c['TargetID'],
+                         _answer_index(questions[c['QuestionID']]['ValidAnswers'], c['Threshold']))
+                        for c in json_out['criteria']])
+
+        rows = []
+        for cav in json_out['caveats']:
+            if cav['QuestionID'] not in questions:
+                continue
+            valid_answers = questions[cav['QuestionID']]['ValidAnswers']
+            if 'Answers' in cav:
+                for ans in cav['Answers']:
+                    if 'NoteID' in ans:
+                        rows.append((cav['QuestionID'], cav['TargetID'],
+                                     _answer_index(valid_answers, ans['Answer']), ans['NoteID']))
+            else:  # old-style caveats, one answer per entry
+                rows.append((cav['QuestionID'], cav['TargetID'],
+                             _answer_index(valid_answers, cav['Answer']), cav['NoteID']))
+        db.executemany('INSERT INTO caveats (QuestionID, TargetID, Answer, NoteID) VALUES (?, ?, ?, ?)', rows)
+        db.commit()
+    finally:
+        db.close()
+
+    print "Snapshot written to {0}.".format(filename)
+    return filename
+
+
+def _loads_all(name):
+    """
+    A SqliteElementSet method that reads the whole table, then defers to SemanticElementSet
+    """
+    base = getattr(SemanticElementSet, name)
+
+    def method(self, *args, **kwargs):
+        self.load()
+        return base(self, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = base.__doc__
+    return method
+
+
+class SqliteElementSet(SemanticElementSet):
+    """
+    A SemanticElementSet backed by the attributes or notes table of a snapshot database.
+
+    Single-element lookups (obj[key], len, keys) are served from the database, with each element read once and
+    cached.  Operations that need every element read the whole table into the usual SemanticElementSet structures
+    first (see load()); from then on the set behaves as if it had been built in memory.
+
+    Internals, in addition to SemanticElementSet's:
+        obj._db = sqlite3 connection
+        obj._table = 'attributes' or 'notes'
+        obj._cache[key] = SemanticElement read from the database, until load()
+        obj.loaded = True once the whole table has been read
+    """
+    def __init__(self, db, table, ns_uuid=None, colormap=None):
+        super(SqliteElementSet, self).__init__(ns_uuid=ns_uuid, colormap=colormap)
+        self._db = db
+        self._table = table
+        self._cache = dict()
+        self.loaded = False
+
+    def load(self):
+        """
+        Read every element into memory
+        :return:
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+        rows = self._db.execute('SELECT id, text, color FROM %s ORDER BY seq' % self._table).fetchall()
+        self.bulk_load([r[1] for r in rows], [r[2] for r in rows], keys=[uuid.UUID(r[0]) for r in rows])
+        self._cache.clear()
+
+    def __len__(self):
+        if self.loaded:
+            return super(SqliteElementSet, self).__len__()
+        return self._db.execute('SELECT COUNT(*) FROM %s' % self._table).fetchone()[0]
+
+    def __getitem__(self, key):
+        if self.loaded or key is None:
+            return super(SqliteElementSet, self).__getitem__(key)
+        if not isinstance(key, uuid.UUID):
+            key = uuid.UUID(key)
+        try:
+            return self._cache[key]
+        except KeyError:
+            row = self._db.execute('SELECT text, color FROM %s WHERE id = ?' % self._table, (str(key),)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            element = SemanticElement(row[0], fill_color=row[1])
+            self._cache[key] = element
+            return element
+
+    def keys(self):
+        if self.loaded:
+            return super(SqliteElementSet, self).keys()
+        return [uuid.UUID(r[0]) for r in self._db.execute('SELECT id FROM %s ORDER BY seq' % self._table)]
+
+    def set_colormap(self, colormap, check=True):
+        if self.loaded:
+            return super(SqliteElementSet, self).set_colormap(colormap, check=check)
+        colormap = Colormap.coerce(colormap)
+        if check and colormap is not None:
+            colors = [r[0] for r in self._db.execute('SELECT DISTINCT color FROM %s' % self._table)]
+            missing = colormap.missing(colors)
+            if len(missing) > 0:
+                raise MsspError('Fill colors %s are not in the new colormap' % ', '.join(missing))
+        super(SqliteElementSet, self).set_colormap(colormap, check=False)
+
+    get_index = _loads_all('get_index')
+    __setitem__ = _loads_all('__setitem__')
+    search = _loads_all('search')
+    search_terms = _loads_all('search_terms')
+    search_tokens = _loads_all('search_tokens')
+    build_index = _loads_all('build_index')
+    near_duplicates = _loads_all('near_duplicates')
+    find_string = _loads_all('find_string')
+    bulk_load = _loads_all('bulk_load')
+    add_element = _loads_all('add_element')
+    update_text = _loads_all('update_text')
+    update_color = _loads_all('update_color')
+    test_dict_integrity = _loads_all('test_dict_integrity')
@@ -86,9 +86,10 @@ def do_record_title_and_cat(E, sheet, rid, ref, record='target'):
 def update_target_titles(E, sel):
     sheet = open_sheet(sel)
     tids = [tid for tid in E.targets_for(sel) if E._targets[tid].title is None]
-    for tid in tids:
-        ref = E._targets[tid].reference()
-        do_record_title_and_cat(E, sheet, tid, ref)
+    with E.batch_edits():
+        for tid in tids:
+            ref = E._targets[tid].reference()
+            do_record_title_and_cat(E, sheet, tid, ref)
 
 
 def update_assessment_question_titles(E):
@@ -99,13 +100,14 @@ def update_assessment_question_titles(E):
     """
     sheet = open_sheet('Assessment')
     qids = [k for k, q in enumerate(E._questions) if q is not None and q.title is None]
-    for qid in qids:
-        ref = [k for k in E._questions[qid].references if k[0] == 'Assessment']
-        if len(ref) != 1:
-            continue
-        myref = ('AssessmentIndices', ref[0][1])
-
-        do_record_title_and_cat(E, sheet, qid, myref, record='question')
+    with E.batch_edits():
+        for qid in qids:
+            ref = [k for k in E._questions[qid].references if k[0] == 'Assessment']
+            if len(ref) != 1:
+                continue
+            myref = ('AssessmentIndices', ref[0][1])
+
+            do_record_title_and_cat(E, sheet, qid, myref, record='question')
 
 
 def run_update():
@@ -0,0 +1,188 @@
+"""
+Token inverted index over the text of a SemanticElementSet.
+
+Element text is lower-cased and split into word tokens.  The index maps each token to the elements containing it,
+with the token positions within each element, and keeps the vocabulary sorted so that a fragment can be looked up
+as a prefix by bisection.  That serves three kinds of query without touching the element text:
+
+ - token: elements containing a whole word;
+ - prefix: elements containing a word that starts with a fragment (search-as-you-type);
+ - phrase: elements containing a run of words in sequence.
+
+SemanticElementSet.search() takes regexes and matches them anywhere in the text, so for those the index only
+narrows the field: candidates() returns a superset of the elements that can contain a literal (regex-free) search
+string, and the caller confirms each candidate with the regex.  Patterns with regex syntax are not served.
+"""
+
+from __future__ import unicode_literals
+
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+
+token_re = re.compile(r'\w+', flags=re.U)
+regex_meta_re = re.compile(r'[.^$*+?{}\[\]\\|()]')
+phrase_re = re.compile(r'"([^"]*)"')
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens of a text, in order
+    :param text: unicode (or None)
+    :return: list of unicode
+    """
+    if text is None:
+        return []
+    return token_re.findall(unicode(text).lower())
+
+
+class TextIndex(object):
+    """
+    Internals:
+        obj._postings[token][key] = list of positions of token in the text of element key
+        obj._tokens[key] = list of tokens of element key, in order
+        obj._vocab = sorted list of all tokens in the index
+    """
+    def __init__(self, items=()):
+        """
+
+        :param items: iterable of (key, text) pairs
+        :return:
+        """
+        self._postings = defaultdict(dict)
+        self._tokens = dict()
+        self._vocab = []
+        for key, text in items:
+            self.add(key, text)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, key):
+        return key in self._tokens
+
+    def add(self, key, text):
+        """
+        Index an element's text, replacing any earlier text for the same key
+        """
+        if key in self._tokens:
+            self.remove(key)
+        tokens = tokenize(text)
+        self._tokens[key] = tokens
+        for i, token in enumerate(tokens):
+            if token not in self._postings:
+                insort(self._vocab, token)
+            self._postings[token].setdefault(key, []).append(i)
+
+    def remove(self, key):
+        """
+        Drop an element from the index
+        """
+        for token in set(self._tokens.pop(key, [])):
+            del self._postings[token][key]
+            if len(self._postings[token]) == 0:
+                del self._postings[token]
+                del self._vocab[bisect_left(self._vocab, token)]
+
+    def _complete(self, fragment):
+        """
+        Vocabulary tokens starting with fragment
+        """
+        start = bisect_left(self._vocab, fragment)
+        end = start
+        while end < len(self._vocab) and self._vocab[end].startswith(fragment):
+            end += 1
+        return self._vocab[start:end]
+
+    def token(self, word):
+        """
+        Keys of elements containing the whole word
+        :return: set
+        """
+        if word not in self._postings:
+            return set()
+        return set(self._postings[word].keys())
+
+    def prefix(self, fragment):
+        """
+        Keys of elements containing a word that starts with fragment
+        :return: set
+        """
+        keys = set()
+        for token in self._complete(fragment):
+            keys.update(self._postings[token].keys())
+        return keys
+
+    def phrase(self, words, last_prefix=False):
+        """
+        Keys of elements containing the words consecutively
+        :param words: list of tokens (use tokenize() on a raw string)
+        :param last_prefix: allow the last word to match as a prefix
+        :return: set
+        """
+        if len(words) == 0:
+            return set()
+        last = self._complete(words[-1]) if last_prefix else [words[-1]]
+        keys = self.prefix(words[-1]) if last_prefix else self.token(words[-1])
+        for word in words[:-1]:
+            keys &= self.token(word)
+        if len(words) == 1:
+            return keys
+        found = set()
+        for key in keys:
+            tokens = self._tokens[key]
+            for i in self._postings[words[0]][key]:
+                j = i + len(words) - 1
+                if j < len(tokens) and tokens[i:j] == words[:-1] and tokens[j] in last:
+                    found.add(key)
+                    break
+        return found
+
+    def query(self, string):
+        """
+        Search-as-you-type: keys of elements matching every word of the query, the last word as a prefix.
+        Double-quoted parts of the query must match as phrases.
+        :param string: the query
+        :return: set
+        """
+        keys = None
+        for quoted in phrase_re.findall(string):
+            words = tokenize(quoted)
+            if len(words) > 0:
+                found = self.phrase(words)
+                keys = found if keys is None else keys & found
+        words = tokenize(phrase_re.sub(' ', string))
+        for i, word in enumerate(words):
+            found = self.prefix(word) if i == len(words) - 1 else self.token(word)
+            keys = found if keys is None else keys & found
+        if keys is None:
+            return set(self._tokens.keys())
+        return keys
+
+    def candidates(self, string):
+        """
+        Keys of the elements whose text can contain string, read as a case-insensitive literal.  The first word
+        of the string may end a longer word of the text, and the last word may begin one.
+        :param string: a search string
+        :return: set, or None if the string has regex syntax or no words, so the index cannot serve it
+        """
+        if regex_meta_re.search(string):
+            return None
+        words = tokenize(string)
+        if len(words) == 0:
+            return None
+        if len(words) == 1:
+            keys = set()
+            for token in self._vocab:
+                if words[0] in token:
+                    keys.update(self._postings[token].keys())
+            return keys
+        keys = self.prefix(words[-1])
+        for word in words[1:-1]:
+            keys &= self.token(word)
+        first = set()
+        for token in self._vocab:
+            if token.endswith(words[0]):
+                first.update(self._postings[token].keys())
+        return keys & first
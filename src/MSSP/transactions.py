@@ -0,0 +1,116 @@
+"""
+Edit transactions and undo log for MsspDataStore.
+
+Content edits (refactor_answers, delete_answer, merge_answers, merge_questions) change the criteria, caveats and
+question tables in place.  Before each change the data store logs a compact inverse operation: the affected row
+labels and their old values, the rows it removed, or the old state of a question.  Row labels, unlike positions,
+are unchanged by later attribute mapping edits, which are not logged.  The inverse operations of one edit, or of
+one explicit transaction, form a group.  Rolling back or undoing a group replays its inverse operations in
+reverse order, so neither atomicity nor undo needs a copy of the tables.
+
+Inverse operations are tuples whose first element names the kind:
+
+    ('values', table, column, labels, old_values) restore column values at the given row labels
+    ('rows', table, removed)                      re-insert a DataFrame of removed rows, in label order
+    ('answers', question, old_valid_answers)      restore a question's valid_answers list
+    ('insert_answer', question, index, answer)    put a deleted answer back at its index in valid_answers
+    ('question', question, obj, old_state)        restore a question record: obj (or None) with its saved
+                                                  __dict__ state
+"""
+
+from MSSP.exceptions import MsspError
+
+
+class UndoLog(object):
+    """
+    Groups of inverse operations.  begin() opens a group (nested calls join the open group), log() adds to it,
+    and commit() closes it onto the undo stack.  rollback() discards the open group and returns its operations,
+    latest first; pop() does the same for the most recently committed group, and peek() returns it without removing
+    it.
+    """
+    def __init__(self, limit=None):
+        """
+
+        :param limit: maximum number of committed groups kept for undo (default: no limit)
+        :return:
+        """
+        self.limit = limit
+        self._groups = []
+        self._open = None
+        self._depth = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    @property
+    def active(self):
+        return self._open is not None
+
+    def begin(self, label=None):
+        if self._open is None:
+            self._open = (label, [])
+        self._depth += 1
+
+    def log(self, op):
+        if self._open is None:
+            raise MsspError('No open transaction')
+        self._open[1].append(op)
+
+    def commit(self):
+        """
+        Close one level of the open group; the outermost commit puts it on the undo stack
+        :return: True if the group was closed
+        """
+        if self._open is None:
+            raise MsspError('No open transaction')
+        self._depth -= 1
+        if self._depth > 0:
+            return False
+        if len(self._open[1]) > 0:
+            self._groups.append(self._open)
+            if self.limit is not None and len(self._groups) > self.limit:
+                self._groups.pop(0)
+        self._open = None
+        return True
+
+    def rollback(self):
+        """
+        Abandon the open group, at every nesting level
+        :return: its inverse operations, latest first
+        """
+        if self._open is None:
+            raise MsspError('No open transaction')
+        ops = self._open[1]
+        self._open = None
+        self._depth = 0
+        return list(reversed(ops))
+
+    def labels(self):
+        """
+        Labels of the committed groups, oldest first
+        """
+        return [label for label, ops in self._groups]
+
+    def peek(self):
+        """
+        The most recently committed group, left on the stack
+        :return: (label, inverse operations latest first)
+        """
+        if self._open is not None:
+            raise MsspError('Cannot undo inside an open transaction')
+        if len(self._groups) == 0:
+            raise MsspError('Nothing to undo')
+        label, ops = self._groups[-1]
+        return label, list(reversed(ops))
+
+    def pop(self):
+        """
+        Remove the most recently committed group
+        :return: (label, inverse operations latest first)
+        """
+        label, ops = self.peek()
+        self._groups.pop()
+        return label, ops
+
+    def clear(self):
+        self._groups = []
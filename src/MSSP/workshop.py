@@ -94,39 +94,40 @@ def check_questions_on_sheet(E, sel, rows=None):
 
     sheet = open_wk_sheet(sel)
 
-    for row in rows:
-        print('update title string')
-        title = update_attr(E,
-                            get_cell(sheet, row, workshop_sel[sel]['title']),
-                            get_cell(sheet, row, workshop_sel[sel]['newtitle']))
-
-        print('Find question ID')
-        q = E.questions_with_attribute(title)
-
-        if len(q) != 1:
-            hint = get_cell(sheet, row, workshop_sel[sel]['hint'])
-            if hint is None:
-                print('%s row %d: Found %d matches; cannot isolate question ID' % (sel, row, len(q)))
-                continue
+    with E.batch_edits():
+        for row in rows:
+            print('update title string')
+            title = update_attr(E,
+                                get_cell(sheet, row, workshop_sel[sel]['title']),
+                                get_cell(sheet, row, workshop_sel[sel]['newtitle']))
+
+            print('Find question ID')
+            q = E.questions_with_attribute(title)
+
+            if len(q) != 1:
+                hint = get_cell(sheet, row, workshop_sel[sel]['hint'])
+                if hint is None:
+                    print('%s row %d: Found %d matches; cannot isolate question ID' % (sel, row, len(q)))
+                    continue
+                else:
+                    qid = int(hint)
             else:
-                qid = int(hint)
-        else:
-            qid = q[0]
-
-        if E._questions[qid].title is None:
-            print('set title')
-            E.set_title(qid, title)
-
-        if 'category' in workshop_sel[sel]:
-            if E._questions[qid].category is None:
-                print('set category')
-                E.set_category(qid, E.find_or_create_attribute(get_cell(sheet, row, workshop_sel[sel]['category'])))
-
-        print('add extras')
-        for col in workshop_sel[sel]['extras']:
-            attr = E.find_or_create_attribute(get_cell(sheet, row, col))
-            E.add_attribute_mapping(qid, attr)
-
+                qid = q[0]
+
+            if E._questions[qid].title is None:
+                print('set title')
+                E.set_title(qid, title)
+
+            if 'category' in workshop_sel[sel]:
+                if E._questions[qid].category is None:
+                    print('set category')
+                    E.set_category(qid, E.find_or_create_attribute(
+                        get_cell(sheet, row, workshop_sel[sel]['category'])))
+
+            print('add extras')
+            for col in workshop_sel[sel]['extras']:
+                attr = E.find_or_create_attribute(get_cell(sheet, row, col))
+                E.add_attribute_mapping(qid, attr)
 
 
 def run_update(*args):